@@ -91,16 +91,22 @@ implemented here::
   for reading the Amplitude and RF status
 """
 # -*- coding: utf-8 -*-
+import enum
 import logging
+import numpy as np
 import Pyro5
 import random
 
-from local_dirs import log_dir
 import Radio_Astronomy as RA
 import support
 from support.pyro.pyro5_server import Pyro5Server
+try:
+  import numba
+except ImportError:
+  numba = None
 
 logger = logging.getLogger(__name__)
+np_rng = np.random.default_rng()
 
 T_CBG = 2.73 # K
 T_rx = {1: {"E": 19.65, "H": 19.75}, 2: {"E": 22.27, "H": 20.55}} # from paper
@@ -114,9 +120,230 @@ def T_sky(feed, pol):
 def T_load(feed, pol):
   return T_rx[feed][pol] + T_amb
 
+# operating temperatures don't change at run time so tabulate them once
+T_SKY_TBL = {(f, p): T_sky(f, p) for f in (1, 2) for p in ("E", "H")}
+T_LOAD_TBL = {(f, p): T_load(f, p) for f in (1, 2) for p in ("E", "H")}
+
+class FeedState(enum.IntEnum):
+  """
+  position of a feed's ambient load
+  """
+  SKY = 0
+  LOAD = 1
+
+# accepted forms of the ``set_feed`` state argument
+_STATE_MAP = {"sky": FeedState.SKY, "load": FeedState.LOAD,
+              0: FeedState.SKY, 1: FeedState.LOAD}
+
 # these divide T_op to give power in W
 tsys_factor = {1: {'E':  999883083, 'H': 840000000},
                2: {'E':  690000000, 'H': 705797017}}
+# so read_PM can multiply instead of divide
+INV_TSYS = {f: {p: 1.0/tsys_factor[f][p] for p in ("E", "H")} for f in (1, 2)}
+
+def _PM_kernel_loop(load_state, preamp_state, sky_T, load_T, inv_tsys,
+                    nd_temp, nd_state, r):
+  """
+  power meter readings for the four channels; compiled with Numba
+  """
+  out = np.empty(4)
+  for i in range(4):
+    if not preamp_state[i]:
+      out[i] = 1e-10
+      continue
+    if load_state[i]:
+      T_op = load_T[i] + 0.1*r[i]
+    else:
+      T_op = sky_T[i] + 0.5*r[i]
+    if nd_state:
+      T_op += nd_temp
+    out[i] = T_op*inv_tsys[i]
+  return out
+
+def _PM_kernel_numpy(load_state, preamp_state, sky_T, load_T, inv_tsys,
+                     nd_temp, nd_state, r):
+  """
+  power meter readings for the four channels when Numba is not available
+  """
+  T_op = np.where(load_state.astype(bool), load_T + 0.1*r, sky_T + 0.5*r)
+  if nd_state:
+    T_op += nd_temp
+  return np.where(preamp_state.astype(bool), T_op*inv_tsys, 1e-10)
+
+if numba:
+  _PM_kernel = numba.njit(cache=True, fastmath=True)(_PM_kernel_loop)
+else:
+  _PM_kernel = _PM_kernel_numpy
+
+# front end components; module level so that they can be pickled
+
+class Attenuator(object):
+  """
+  PIN diode attenuator for noise diode signal
+
+  With control voltage 0 V the ND power is about 39 K.
+  """
+  logger = logging.getLogger(__name__+'.K_FE.NoiseDiode.Attenuator')
+
+  # polynomial fit from ``ND_atten_fit.py``
+  _CTRL_V_COEFS = np.array([ 3.85013993e-18,  -6.61616152e-15,
+                             4.62228606e-12,  -1.68733555e-09,
+                             3.43138077e-07,  -3.82875899e-05,
+                             2.20822016e-03,  -8.38473034e-02,
+                             1.52678586e+00])
+
+  def __init__(self, parent=None, atten=0):
+    """
+    initialize attenuator at 0 dB
+    """
+    self.parent = parent
+    self.set_atten(atten)
+
+  def set_atten(self, atten):
+    """
+    """
+    self.atten = atten
+    if self.parent:
+      self.parent.temp = self.parent.max*RA.gain(self.atten)
+
+  def get_atten(self):
+    """
+    """
+    return self.atten
+
+  def ctrl_voltage(self, ND_K):
+    """
+    control voltage for specify ND power in kelvin (scalar or array)
+    """
+    return np.polyval(self._CTRL_V_COEFS, ND_K)
+
+class NoiseDiode(object):
+  """
+  Noise diode which injects noise power into all channels
+
+  The unattenuated ND power is 384.6 K. (See program ``ND_atten_fit.py``)
+  """
+  logger = logging.getLogger(__name__+'.K_FE.NoiseDiode')
+
+  def __init__(self):
+    """
+    """
+    self.max = 384.6 # K
+    self.state = 0 # off
+    # the attenuator sets self.temp
+    self.atten = Attenuator(self, atten=-9.86)
+
+  def set_state(self, state):
+    """
+    """
+    self.state = state
+
+  def get_state(self):
+    """
+    """
+    return self.state
+
+  def get_temperature(self):
+    """
+    ND power in K; updated only when the attenuation changes
+    """
+    return self.temp
+
+class AmbientLoad(object):
+  """
+  Waveguide load attached behind feed
+  """
+  logger = logging.getLogger(__name__+'.K_FE.Feed.AmbientLoad')
+
+  def __init__(self, parent=None):
+    """
+    assign an ambient load to parent Feed
+    """
+    self.parent = parent
+    self.state = 0 # out
+    self.temp = 320 # K, approx. physical temperature
+
+  def set_state(self, state):
+    """
+    """
+    self.state = state
+    if self.parent:
+      self.parent.parent._load_state[self.parent._slots] = state
+
+  def get_state(self):
+    """
+    """
+    return self.state
+
+class Channel(object):
+  """
+  Output for one polarization from an orthomode
+  """
+  logger = logging.getLogger(__name__+'.K_FE.Feed.Channel')
+
+  def __init__(self, parent, pol, nd=None):
+    """
+    assign polarization and the noise diode which feeds this channel
+    """
+    self._dbg = self.logger.isEnabledFor(logging.DEBUG)
+    self.parent = parent
+    self.pol = pol
+    self._nd = nd
+    self._rng = parent.parent._rng
+    self._T_sky = T_SKY_TBL[(parent.number, pol)]
+    self._T_load = T_LOAD_TBL[(parent.number, pol)]
+    self._inv_tsys = INV_TSYS[parent.number][pol]
+    self.set_PM_mode('W')
+
+  def set_PM_mode(self, mode):
+    """
+    """
+    self.PM_mode = mode
+
+  def read_PM(self):
+    """
+    read power meter attached to channel
+    """
+    if self.parent.preamp_state == 0:
+      return 1e-10
+    if self.parent.load.state:
+      # load is in
+      T_op = self._T_load + 0.1*self._rng.random()
+    else:
+      T_op = self._T_sky + 0.5*self._rng.random()
+    if self._dbg:
+      self.logger.debug("read_PM: T_op = %.1f", T_op)
+    nd = self._nd
+    if nd.state:
+      T_op += nd.temp
+    return T_op*self._inv_tsys
+
+class Feed(object):
+  """
+  Feed horn and associated waveguide components
+  """
+  logger = logging.getLogger(__name__+'.K_FE.Feed')
+
+  def __init__(self, parent, number):
+    """
+    Assign Feed to a beam defined by the feed position 1 or 2
+    """
+    self.parent = parent
+    self.number = number # number
+    self.position = [0, -0.012, +0.012][number] # inch
+    self.name = [None, "minus", "plus"][number]
+    self._slots = slice(2*(number-1), 2*number) # both pols in parent SoA
+    self.load = AmbientLoad(self)
+    self.chan = {"E": Channel(self, pol="E", nd=parent.nd),
+                 "H": Channel(self, pol="H", nd=parent.nd)}
+    self.set_preamp_bias(state=1)
+
+  def set_preamp_bias(self, state=1):
+    """
+    preamp state 0 is bias off, state 1 is bias on
+    """
+    self.preamp_state = state
+    self.parent._preamp_state[self._slots] = state
 
 @Pyro5.api.expose                
 class K_FE(support.PropertiedClass):
@@ -126,159 +353,26 @@ class K_FE(support.PropertiedClass):
     """
     """
     support.PropertiedClass.__init__(self)
-    self.logger = logging.getLogger(logger.name+'.K_FE')
-    self.feed = {1: K_FE.Feed(self, 1), 2: K_FE.Feed(self, 2)}
-    self.nd = K_FE.NoiseDiode()
+    self.logger = logger.getChild('K_FE')
+    self._dbg = self.logger.isEnabledFor(logging.DEBUG)
+    self._rng = random.Random() # avoids the shared module-level generator
+    self._temp_rng = np.random.default_rng()
+    # structure-of-arrays view of the channel states, indexed 2*(feed-1)+pol;
+    # kept in step by AmbientLoad.set_state and Feed.set_preamp_bias
+    self._load_state = np.zeros(4, np.uint8)
+    self._preamp_state = np.ones(4, np.uint8)
+    self.nd = NoiseDiode() # needed by the feed channels
+    self.feed = {1: Feed(self, 1), 2: Feed(self, 2)}
+    # per-channel constants in read_PMs order: F1E, F1H, F2E, F2H
+    self._chans = [(f, p) for f in (1, 2) for p in ("E", "H")]
+    self._sky_T = np.array([T_SKY_TBL[c] for c in self._chans])
+    self._load_T = np.array([T_LOAD_TBL[c] for c in self._chans])
+    self._inv_tsys = np.array([INV_TSYS[f][p] for f, p in self._chans])
+    self.read_PMs() # compiles the kernel if Numba is used
     # These are receiver properties as well as signal properties
     self.data['frequency'] = 22.0 # GHz
     self.data['bandwidth'] = 10.  # GHz
-  
-  class Feed(object):
-    """
-    Feed horn and associated waveguide components
-    """
-    def __init__(self, parent, number):
-      """
-      Assign Feed to a beam defined by the feed position 1 or 2
-      """
-      self.parent = parent
-      self.logger = logging.getLogger(logger.name+'.K_FE.Feed')
-      self.number = number # number
-      self.position = [0, -0.012, +0.012][number] # inch
-      self.name = [None, "minus", "plus"][number]
-      self.load = K_FE.Feed.AmbientLoad()
-      self.chan = {"E": K_FE.Feed.Channel(self, pol="E"), 
-                   "H": K_FE.Feed.Channel(self, pol="H")}
-      self.set_preamp_bias(state=1)
-      
-    def set_preamp_bias(self, state=1):
-      """
-      preamp state 0 is bias off, state 1 is bias on
-      """
-      self.preamp_state = state
 
-    class AmbientLoad(object):
-      """
-      Waveguide load attached behind feed
-      """
-      def __init__(self):
-        """
-        assign an ambient load to parent Feed
-        """
-        self.logger = logging.getLogger(logger.name+'.K_FE.Feed.AmbientLoad')
-        self.state = 0 # out
-        self.temp = 320 # K, approx. physical temperature
-    
-      def set_state(self, state):
-        """
-        """
-        self.state = state
-    
-      def get_state(self):
-        """
-        """
-        return self.state
-    
-    class Channel(object):
-      """
-      Output for one polarization from an orthomode
-      """
-      def __init__(self, parent, pol):
-        """
-        assign polarization
-        """
-        self.logger = logging.getLogger(logger.name+'.K_FE.Feed.Channel')
-        self.parent = parent
-        self.pol = pol
-        self.set_PM_mode('W')
-      
-      def set_PM_mode(self, mode):
-        """
-        """
-        self.PM_mode = mode
-        
-      def read_PM(self):
-        """
-        read power meter attached to channel
-        """
-        if self.parent.preamp_state == 0:
-          return 1e-10
-        feed = self.parent.number
-        if self.parent.load.state:
-          # load is in
-          T_op = T_load(feed, self.pol) + 0.1*random.random()
-        else:
-          T_op = T_sky(feed, self.pol) + 0.5*random.random()
-        self.logger.debug("read_PM: T_op = %.1f", T_op)
-        nd = self.parent.parent.nd
-        if nd.state:
-          T_op += nd.get_temperature()
-        return T_op/tsys_factor[feed][self.pol]
-        
-  class NoiseDiode(object):
-    """
-    Noise diode which injects noise power into all channels
-    
-    The unattenuated ND power is 384.6 K. (See program ``ND_atten_fit.py``)
-    """
-    def __init__(self):
-      """
-      """
-      self.logger = logging.getLogger(logger.name+'.K_FE.NoiseDiode')
-      self.max = 384.6 # K
-      self.state = 0 # off
-      self.atten = K_FE.NoiseDiode.Attenuator(self, atten=-9.86)
-      self.get_temperature()
-    
-    def set_state(self, state):
-      """
-      """
-      self.state = state
-    
-    def get_state(self):
-      """
-      """
-      return self.state
-    
-    def get_temperature(self):
-      """
-      """
-      self.temp = self.max*RA.gain(self.atten.atten)
-      return self.temp
-    
-    class Attenuator(object):
-      """
-      PIN diode attenuator for noise diode signal
-      
-      With control voltage 0 V the ND power is about 39 K.
-      """
-      def __init__(self, parent=None, atten=0):
-        """
-        initialize attenuator at 0 dB
-        """
-        self.logger = logging.getLogger(logger.name+'.K_FE.NoiseDiode.Attenuator')
-        self.atten = atten
-      
-      def set_atten(self, atten):
-        """
-        """
-        self.atten = atten
-        self.parent.temp = self.parent.max*RA.gain(self.atten)
-      
-      def get_atten(self):
-        """
-        """
-        return self.atten
-        
-      def ctrl_voltage(self, ND_K):
-        """
-        control voltage for specify ND power in kelvin
-        """
-        coefs = array([  3.85013993e-18,  -6.61616152e-15,   4.62228606e-12,
-                        -1.68733555e-09,   3.43138077e-07,  -3.82875899e-05,
-                         2.20822016e-03,  -8.38473034e-02,   1.52678586e+00])
-        return scipy.polyval(coefs,ND)
-  
   # K_FE methods for Pyro clients
   def get_feed(self, feed):
     """
@@ -296,15 +390,20 @@ class K_FE(support.PropertiedClass):
     Set the feed to either 1 or 2.
     Args:
       feed (int): 1 or 2
-      state (str): 'load' or 'sky'
+      state (FeedState, int or str): 0 or 'sky', 1 or 'load'
     Returns:
       None
     """
-    if state.strip().lower() == 'sky':
-      self.feed[feed].load = 0
-    elif state.strip().lower() == 'load':
-      self.feed[feed].load = 1
-    self.frontend.set_feed(feed, state)
+    try:
+      code = _STATE_MAP.get(state)
+    except TypeError: # unhashable
+      code = None
+    if code is None and isinstance(state, str):
+      code = _STATE_MAP.get(state.strip().lower())
+    if code is None:
+      raise ValueError("feed state must be 0 or 'sky', 1 or 'load', not %r"
+                       % (state,))
+    self.feed[feed].load.set_state(int(code))
 
   def get_ND_state(self):
     """Return current state of Noise diode"""
@@ -335,106 +434,148 @@ class K_FE(support.PropertiedClass):
     self.logger.debug("Setting preamp bias for feed {} to {}".format(feed, state))
     self.feed[feed].chan(feed, state)
 
+  def set_log_level(self, level):
+    """
+    Set the simulator logging level
+    
+    The power meter methods cache whether debugging is enabled so this must
+    be used, rather than setting the level directly, to change it.
+    
+    Args:
+      level (int or str): e.g. logging.DEBUG or "DEBUG"
+    """
+    self.logger.setLevel(level)
+    self._dbg = self.logger.isEnabledFor(logging.DEBUG)
+    for feed in self.feed.values():
+      for chan in feed.chan.values():
+        chan._dbg = chan.logger.isEnabledFor(logging.DEBUG)
+
   def read_PMs(self):
     """
     computes roughly 50~K on sky
     """
-    number=0; readings = []
-    for fnum in sorted(self.feed):
-      for pol in sorted(self.feed[fnum].chan):
-        number += 1
-        readings.append((number, self.feed[fnum].chan[pol].read_PM()))
-    self.logger.debug("read_PMs: readings: %s", readings)
+    pwr = _PM_kernel(self._load_state, self._preamp_state, self._sky_T,
+                     self._load_T, self._inv_tsys, self.nd.temp,
+                     bool(self.nd.state), np_rng.random(4))
+    readings = list(enumerate(pwr.tolist(), 1))
+    if self._dbg:
+      self.logger.debug("read_PMs: readings: %s", readings)
     return readings
     
   def read_temp(self):
     """
     read the four front end physical temperatures
     """
+    j12, j70 = self._temp_rng.random(2).tolist()
     return {"load1": self.feed[1].load.temp,
-            "12K":    15 + 0.01*random.random(),
+            "12K": 15 + 0.01*j12,
             "load2": self.feed[2].load.temp,
-            "70K":    80 + 0.5*random.random()}
+            "70K": 80 + 0.5*j70}
   
 
 class FEServer(Pyro5Server, K_FE):
     """
     Server that controls the Front End.
     """
+    _STATE_NAMES = ("sky", "load")
+    _FEED_REPORT = "feed 1 is on the {}\nfeed 2 is on the {}\n"
+    
     def __init__(self, name, FElogger=None, **kwargs):
         if not FElogger:
-            FElogger = logging.getLogger(logger.name+".FEServer")
+            FElogger = logger.getChild("FEServer")
         Pyro5Server.__init__(self, obj=self, name=name, logger=FElogger, **kwargs)
         K_FE.__init__(self)
+        self._wbdc_dispatch = self._build_WBDC_dispatch()
+    
+    def _build_WBDC_dispatch(self):
+      """
+      map legacy option codes to handlers
+      """
+      d = {12: self._check_feeds,
+           13: lambda: self._set_load(1, 0),
+           14: lambda: self._set_load(1, 1),
+           15: lambda: self._set_load(2, 0),
+           16: lambda: self._set_load(2, 1),
+           22: lambda: self.nd.state,        # get the noise diode state
+           23: lambda: self.nd.set_state(1), # noise diode on
+           24: lambda: self.nd.set_state(0), # noise diode off
+           25: lambda: self.feed[1].set_preamp_bias(1),
+           26: lambda: self.feed[1].set_preamp_bias(0),
+           27: lambda: self.feed[2].set_preamp_bias(1),
+           28: lambda: self.feed[2].set_preamp_bias(0)}
+      # power meter modes: 391-394 for ``W'', 401-404 for ``dBm'', as in the
+      # legacy server and as sent by K_4ch.Channel.PowerMeter.set_mode
+      for ch in range(1, 5):
+        d[390+ch] = lambda ch=ch: self._set_PM_mode(ch, 'W')
+        d[400+ch] = lambda ch=ch: self._set_PM_mode(ch, 'dBm')
+      return d
+    
+    def _set_PM_mode(self, ch, mode):
+      """
+      set the mode of power meter 1-4 (F1E, F1H, F2E, F2H)
+      """
+      f, p = self._chans[ch-1]
+      self.feed[f].chan[p].set_PM_mode(mode)
+      return "PM%d mode set to %s" % (ch, mode)
+    
+    def _check_feeds(self):
+      """
+      report the feed states as text
+      """
+      response = self._FEED_REPORT.format(
+                                   self._STATE_NAMES[self.feed[1].load.state],
+                                   self._STATE_NAMES[self.feed[2].load.state])
+      self.logger.debug("set_WBDC(12) response:\n%s", response)
+      return response
+    
+    def _set_load(self, feed, state):
+      """
+      move the load of feed out (0) or in (1)
+      """
+      self.logger.debug("set_WBDC: set feed %d to %s", feed,
+                        self._STATE_NAMES[state])
+      self.feed[feed].load.set_state(state=state)
+    
+    @Pyro5.api.expose
+    def get_feed_states(self):
+      """
+      load states of feeds 1 and 2 (True if load is in)
+      """
+      return bool(self.feed[1].load.state), bool(self.feed[2].load.state)
+    
+    @Pyro5.api.expose
+    def get_states(self):
+      """
+      load states of feeds 1 and 2 and the noise diode state in one call
+      """
+      return self.get_feed_states() + (bool(self.nd.state),)
+    
+    @Pyro5.api.expose
+    def read_all_sensors(self):
+      """
+      power meter readings and temperatures in one call
+      """
+      return {'pms': self.read_PMs(), 'temps': self.read_temp()}
+    
+    @Pyro5.api.expose
+    def snapshot(self):
+      """
+      power meter readings, temperatures and states in one call
+      """
+      return {'pms':   self.read_PMs(),
+              'temps': self.read_temp(),
+              'nd':    bool(self.nd.state),
+              'feeds': self.get_feed_states()}
     
     @Pyro5.api.expose
     def set_WBDC(self, option):
       """
       """
-      if option==12:
-        # to get the feed states
-        statenames = ["sky", "load"]
-        response = ""
-        feeds = list(self.feed.keys())
-        feeds.sort()
-        for feed in feeds:
-          response += "feed {} is on the {}\n".format(feed, 
-                                         statenames[self.feed[feed].load.state])
-        self.logger.debug("set_WBDC({}) response:\n{}".format(option, response))
-        return response
-      elif option==13:
-        self.logger.debug("set_WBDC: set feed 1 to sky")
-        self.feed[1].load.set_state(state=0)
-      elif option==14:
-        self.logger.debug("set_WBDC: set feed 1 to load")
-        self.feed[1].load.set_state(state=1)
-      elif option==15:
-        self.logger.debug("set_WBDC: set feed 2 to sky")
-        self.feed[2].load.set_state(state=0)
-      elif option==16:
-        self.logger.debug("set_WBDC: set feed 2 to load")
-        self.feed[2].load.set_state(state=1)
-      elif option==22:
-        # to get the noise diode state
-        return self.nd.state        
-      elif option==23:
-        # to turn the noise diode on
-        self.nd.set_state(1)
-      elif option==24:
-        # to turn the noise diode off
-        self.nd.set_state(0)
-      elif option==25:
-        # to turn the preamp 1 on
-        self.feed[1].set_preamp_bias(1)
-      elif option==26:
-        # to turn the preamp 1 off
-        self.feed[1].set_preamp_bias(0)
-      elif option==27:
-        # to turn the preamp 2 on
-        self.feed[2].set_preamp_bias(1)
-      elif option==28:
-        # to turn the preamp2 off
-        self.feed[2].set_preamp_bias(0)
-      elif option==390:
-        # to set the power meter mode to ``W''
-        self.feed[1].chan['E'].set_PM_mode('W')
-      elif option==391:
-        self.feed[1].chan['H'].set_PM_mode('W')
-      elif option==392:
-        self.feed[2].chan['E'].set_PM_mode('W')
-      elif option==393:
-        self.feed[2].chan['H'].set_PM_mode('W')
-      elif option==400:
-        # to ```dBm''.
-        self.feed[1].chan['E'].set_PM_mode('dBm')
-      elif option==401:
-        self.feed[1].chan['H'].set_PM_mode('dBm')
-      elif option==402:
-        self.feed[2].chan['E'].set_PM_mode('dBm')
-      elif option==403:
-        self.feed[2].chan['H'].set_PM_mode('dBm')
-      else:
+      handler = self._wbdc_dispatch.get(option)
+      if handler is None:
         self.logger.error('set_WBDC: option %d not recognized', option)
+        return None
+      return handler()
         
 def create_arg_parser():
     """
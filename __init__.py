@@ -39,13 +39,16 @@ These are the signals monitored or controlled by the LabJack::
     2  18    DI    feed 1 on sky
     3  19    DI    feed 2 on sky
 """
+import collections
 import datetime
-import copy
+import concurrent.futures
+import functools
 import logging
 import math
 import Pyro5
 import time
 import random
+import threading
 
 import MonitorControl as MC
 import MonitorControl.FrontEnds as FE
@@ -57,6 +60,63 @@ feeds = ["F1", "F2"] # default names for the feeds
 pols =  ["P1", "P2"]
 plane = {"P1": "E", "P2": "H"}
 
+# vacuum system temperature for each whole degree of elevation; index 0 unused
+_TSYS_VACUUM = [None] + [36/math.sin(math.pi*e/180) for e in range(1, 91)]
+_TSYS_ELEV = frozenset(range(1, 91))
+
+def ttl_cache(seconds=1.0):
+  """
+  Decorator which re-uses a method's result for ``seconds``
+
+  If ``seconds`` is None the instance's ``min_update_interval`` is used.
+
+  Results are kept in the instance's ``_state_cache`` under the method name
+  and only when there is hardware. Methods that change the hardware state
+  remove the affected entries with ``_invalidate``.
+  """
+  def decorator(method):
+    name = method.__name__
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+      if not self.hardware:
+        return method(self, *args, **kwargs)
+      now = time.monotonic()
+      try:
+        value, expiry = self._state_cache[name]
+      except KeyError:
+        pass
+      else:
+        if now < expiry:
+          return value
+      value = method(self, *args, **kwargs)
+      ttl = self.min_update_interval if seconds is None else seconds
+      self._state_cache[name] = (value, now + ttl)
+      return value
+    return wrapper
+  return decorator
+
+def with_retry(fn, *args, attempts=5, base=1.0, cap=30.0, **kwargs):
+  """
+  Calls a server method, retrying with exponential backoff if it can't connect
+
+  The waits are base, 2*base, 4*base, ... seconds, capped at ``cap``, with up
+  to 10% jitter.  The last CommunicationError is raised if all attempts fail.
+
+  @param fn : function or proxy method to call with the other arguments
+  @param attempts : number of tries
+  @type  attempts : int
+  """
+  for attempt in range(attempts):
+    try:
+      return fn(*args, **kwargs)
+    except Pyro5.errors.CommunicationError as details:
+      if attempt == attempts-1:
+        raise
+      delay = min(cap, base*2**attempt)
+      module_logger.warning("with_retry: %s; retrying in %.1f s",
+                            details, delay)
+      time.sleep(delay + random.uniform(0, 0.1*delay))
+
 class K_4ch(FE.FrontEnd):
   """
   The 4-channel downconverter with four inputs for two pols and two feeds.
@@ -102,30 +162,29 @@ class K_4ch(FE.FrontEnd):
     @type  hardware : bool
     """
     self.name = name
-    mylogger = logging.getLogger(module_logger.name+".K_4ch")
+    self._state_cache = {} # see ttl_cache
+    self._cmd_executor = None # see _send_command
+    self._cmd_proxy = None
+    self._pending_cmds = collections.deque() # Futures of queued commands
+    self._last_update = 0.0
+    self.min_update_interval = 1.0 # s; see update
+    mylogger = module_logger.getChild("K_4ch")
+    self._channel_logger = mylogger.getChild("Channel") # shared by channels
     mylogger.debug("__init__: initializing %s", self)
     if inputs == None:
       # This is for Receiver stand-alone testing
       inputs = {}
       for feed in feeds:
         inputs[feed] = MC.Port(self, feed, signal=MC.Beam(feed))
-    mylogger.debug("__init__: %s input channels: %s", self, str(inputs))
+    mylogger.debug("__init__: %s input channels: %s", self, inputs)
     mylogger.debug("__init__: output names: %s", output_names)
     FE.FrontEnd.__init__(self, name, inputs=inputs, output_names=output_names)
     # the next redefines self.logger
     self.logger = mylogger # needed for defining inputs
     if hardware:
-      uri = Pyro5.api.URI("PYRO:FE@localhost:50000")
-      self.hardware = Pyro5.api.Proxy(uri)
-      try:
-        self.hardware.__get_state__()
-      except Pyro5.errors.CommunicationError as details:
-        self.logger.error("__init__: %s", details)
-        raise Pyro5.errors.CommunicationError("is the front end server running?")
-      except AttributeError:
-        # no __get_state__ because we have a connection
-        pass
-      self.hardware._pyroClaimOwnership()
+      self._uri = Pyro5.api.URI("PYRO:FE@localhost:50000")
+      self.hardware = self._connect(self._uri)
+      self._owner = threading.get_ident()
     else:
       # use the simulator
       self.hardware = hardware # that is, False
@@ -136,33 +195,49 @@ class K_4ch(FE.FrontEnd):
     # These are receiver properties as well as signal properties
     self.data['frequency'] = 22.0 # GHz
     self.data['bandwidth'] = 10.  # GHz
-    keys = list(self.inputs.keys())
-    keys.sort()
-    for feed in keys:
-      self.logger.debug("__init__: creating channel '%s'", feed)
-      index = keys.index(feed)
-      beam_signal = MC.Beam(feed)
-      for prop in self.data.keys():
-        beam_signal.data[prop] = self.data[prop]
-      self.channel[feed] = self.Channel(self, feed,
-                                        inputs={feed: self.inputs[feed]},
-                                        output_names=output_names[index],
-                                        signal=beam_signal)
-      self.channel[feed].retract_load()
-      for key in list(self.channel[feed].outputs.keys()):
-        if key[-1].isnumeric():
-          # replace P1/P2 with E/H
-          pol = key[-2:]
-          self.channel[feed].outputs[key].signal['pol'] = plane[pol]
-        else:
-          pol = key[-1]
-          self.channel[feed].outputs[key].signal['pol'] = pol
-        self.logger.debug("__init__: setting '%s' pol to '%s'", key, pol)
-      self.logger.debug("__init__: finished channel '%s'", feed)
-    self.logger.debug("%s output channels: %s\n", self, str(self.outputs))
-    self.set_ND_off()
+    if self.hardware:
+      # the initial settings go to the server in one call
+      batch = Pyro5.api.BatchProxy(self.hardware)
+    else:
+      batch = None
+    for index, feed in enumerate(sorted(self.inputs)):
+      self.channel[feed] = self._build_channel(feed, output_names[index], batch)
+    self.logger.debug("%s output channels: %s\n", self, self.outputs)
+    self.set_ND_off(batch=batch)
+    if batch:
+      list(batch())
     self.update()
     
+  def _build_channel(self, feed, output_names, batch=None):
+    """
+    Creates the channel for a feed and labels its outputs' polarizations
+
+    @param feed : input (feed) name
+    @type  feed : str
+
+    @param output_names : names of the channel's output ports
+    @type  output_names : list of str
+
+    @param batch : collects the channel's initial hardware commands
+    @type  batch : Pyro5.api.BatchProxy
+    """
+    self.logger.debug("_build_channel: creating channel '%s'", feed)
+    beam_signal = MC.Beam(feed)
+    beam_signal.data.update(self.data)
+    channel = self.Channel(self, feed, inputs={feed: self.inputs[feed]},
+                           output_names=output_names, signal=beam_signal,
+                           batch=batch)
+    # names ending in P1/P2 get E/H; otherwise the last letter is the pol
+    pol_map = {key: plane[key[-2:]] if key[-1].isdigit() else key[-1]
+               for key in output_names}
+    debug = self.logger.isEnabledFor(logging.DEBUG)
+    for key, pol in pol_map.items():
+      channel.outputs[key].signal['pol'] = pol
+      if debug:
+        self.logger.debug("_build_channel: setting '%s' pol to '%s'", key, pol)
+    self.logger.debug("_build_channel: finished channel '%s'", feed)
+    return channel
+
   def future__getattr__(self, name):
     """
     This passes unknown method and attribute requests to the server
@@ -170,17 +245,171 @@ class K_4ch(FE.FrontEnd):
     self.logger.debug("__getattr__: checking hardware for '%s'",
                       name)
     if self.hardware is not None:
-      self.hardware._pyroClaimOwnership()
+      self._claim_hardware()
     return getattr(self.hardware, name)
 
+  def _connect(self, uri):
+    """
+    Returns a proxy with a connection to the server kept open
+
+    Pyro5 re-connects the proxy itself, up to three times, if the server drops
+    the connection.
+    """
+    proxy = Pyro5.api.Proxy(uri)
+    proxy._pyroTimeout = 5.0 # s
+    proxy._pyroMaxRetries = 3
+    try:
+      with_retry(proxy._pyroBind)
+    except Pyro5.errors.CommunicationError as details:
+      self.logger.error("_connect: %s", details)
+      raise Pyro5.errors.CommunicationError("is the front end server running?")
+    return proxy
+
+  def _claim_hardware(self):
+    """
+    Takes ownership of the server proxy if the calling thread has changed
+
+    A Pyro5 proxy may only be used by the thread that owns it.  This avoids
+    re-claiming it for every call from the same thread.
+    """
+    tid = threading.get_ident()
+    if tid != self._owner:
+      self.hardware._pyroClaimOwnership()
+      self._owner = tid
+    # let queued commands reach the server before the next request
+    self._wait_for_commands()
+
+  def _wait_for_commands(self):
+    """
+    Waits for every queued command, raising the first failure
+
+    Each Future is removed before it is waited on so a failure is reported
+    only once; later failures are logged.
+    """
+    error = None
+    while self._pending_cmds:
+      cmd = self._pending_cmds.popleft()
+      try:
+        cmd.result()
+      except Exception as details:
+        if error is None:
+          error = details
+        else:
+          self.logger.error("_wait_for_commands: queued command failed: %s",
+                            details)
+    if error is not None:
+      raise error
+
+  def _send_command(self, option, wait=False):
+    """
+    Sends a state-changing option to the server
+
+    The commands are sent in order by one worker thread with its own proxy.
+    Unless ``wait`` is set the caller does not wait for the reply; the next
+    synchronous call waits for the queued commands to finish.
+
+    @param option : legacy option code for ``set_WBDC``
+    @type  option : int
+
+    @param wait : wait for and return the server's response
+    @type  wait : bool
+
+    @return: the response, or a concurrent.futures.Future for it
+    """
+    if self._cmd_executor is None:
+      self._cmd_executor = concurrent.futures.ThreadPoolExecutor(max_workers=1)
+    cmd = self._cmd_executor.submit(self._command_worker, option)
+    self._pending_cmds.append(cmd)
+    if wait:
+      self._wait_for_commands()
+      return cmd.result()
+    return cmd
+
+  def _command_worker(self, option):
+    """
+    Executes ``set_WBDC(option)`` in the command thread
+    """
+    if self._cmd_proxy is None:
+      self._cmd_proxy = self._connect(self._uri)
+    return self._cmd_proxy.set_WBDC(option)
+
+  def close(self):
+    """
+    Finishes the queued commands and frees the command thread and its proxy
+    """
+    try:
+      self._wait_for_commands()
+    finally:
+      if self._cmd_executor is not None:
+        self._cmd_executor.shutdown(wait=True)
+        self._cmd_executor = None
+      if self._cmd_proxy is not None:
+        # the proxy belongs to the finished worker thread
+        self._cmd_proxy._pyroClaimOwnership()
+        self._cmd_proxy._pyroRelease()
+        self._cmd_proxy = None
+
+  def _invalidate(self, *names):
+    """
+    Forgets cached results of the named methods
+    """
+    for name in names:
+      self._state_cache.pop(name, None)
+
+  def set_poll_interval(self, seconds):
+    """
+    Sets the minimum time between state updates from the server
+    """
+    self.min_update_interval = seconds
+
   def update(self):
     """
     Updates the states
+
+    Calls within ``min_update_interval`` of the previous update do nothing.
     """
+    now = time.monotonic()
+    if now - self._last_update < self.min_update_interval:
+      return
+    self._last_update = now
+    if self.hardware:
+      self._claim_hardware()
+      try:
+        F1, F2, self.ND = self.hardware.get_states()
+      except AttributeError:
+        # legacy server
+        pass
+      else:
+        self.channel["F1"].load_in = F1
+        self.channel["F2"].load_in = F2
+        return
     self.feed_states()
     self.get_ND_state()
 
+  @support.test.auto_test(returns=dict)
+  def poll(self):
+    """
+    Gets all the monitor data from the server in one call
+    
+    Updates the load and noise diode states and returns a dict with keys
+    'pms', 'temps', 'nd' and 'feeds'.
+    """
+    if self.hardware:
+      self._claim_hardware()
+      snap = self.hardware.snapshot()
+      self.ND = snap['nd']
+      self.channel["F1"].load_in, self.channel["F2"].load_in = snap['feeds']
+    else:
+      # the simulated state is the channels' own
+      snap = {'pms':   self.read_PMs(),
+              'temps': self.read_temps(),
+              'nd':    self.ND,
+              'feeds': (self.channel["F1"].load_in,
+                        self.channel["F2"].load_in)}
+    return snap
+
   @support.test.auto_test(returns=(True, True))
+  @ttl_cache(seconds=1.0)
   def feed_states(self):
     """
     Report the waveguide load state
@@ -190,10 +419,19 @@ class K_4ch(FE.FrontEnd):
     """
     self.logger.debug("feed_states: called")
     if self.hardware:
-      self.hardware._pyroClaimOwnership()
+      self._claim_hardware()
+      try:
+        states = self.hardware.get_feed_states()
+      except AttributeError:
+        # legacy server; parse the option 12 report below
+        pass
+      else:
+        self.channel["F1"].load_in, self.channel["F2"].load_in = states
+        return tuple(states)
       response = self.hardware.set_WBDC(12)
-      self.logger.debug("feed_states: response from set_WBDC(12): {}".format(response))
-      self.logger.debug("feed_states: channel names: {}".format(list(self.channel.keys())))
+      if self.logger.isEnabledFor(logging.DEBUG):
+        self.logger.debug("feed_states: response from set_WBDC(12): {}".format(response))
+        self.logger.debug("feed_states: channel names: {}".format(list(self.channel.keys())))
       lines = response.split('\n')
       for line in lines[1:2]:
         parts = line.split()
@@ -210,31 +448,41 @@ class K_4ch(FE.FrontEnd):
       return True, True
 
   @support.test.auto_test(returns=str)
-  def set_ND_on(self):
+  def set_ND_on(self, wait=True):
+    """
+    @param wait : if False, return the command's Future instead of the reply
+    """
     if self.hardware:
-      self.hardware._pyroClaimOwnership()
-      response = self.hardware.set_WBDC(23)
+      response = self._send_command(23, wait=wait)
     else:
       response = "on"
     self.ND = True
+    self._invalidate("get_ND_state", "read_all")
     return response
 
   @support.test.auto_test(returns=str)
-  def set_ND_off(self):
-    if self.hardware:
-      self.hardware._pyroClaimOwnership()
-      response = self.hardware.set_WBDC(24)
+  def set_ND_off(self, batch=None, wait=True):
+    """
+    @param wait : if False, return the command's Future instead of the reply
+    """
+    if batch:
+      batch.set_WBDC(24)
+      response = None
+    elif self.hardware:
+      response = self._send_command(24, wait=wait)
     else:
       response = "off"
     self.ND = False
+    self._invalidate("get_ND_state", "read_all")
     return response
 
   @support.test.auto_test(returns=bool)
+  @ttl_cache(seconds=1.0)
   def get_ND_state(self):
     """
     """
     if self.hardware:
-      self.hardware._pyroClaimOwnership()
+      self._claim_hardware()
       self.ND = self.hardware.set_WBDC(22)
     return self.ND
 
@@ -262,19 +510,36 @@ class K_4ch(FE.FrontEnd):
       raise MC.MonitorControlError(spacing,"is not a valid PCG tone interval")
     return "hardware not available"
 
+  @support.test.auto_test(returns=dict)
+  @ttl_cache(seconds=None)
+  def read_all(self):
+    """
+    Reads the power meters and temperatures in one call
+
+    Returns a dict with keys 'pms' and 'temps'.
+    """
+    if self.hardware:
+      self._claim_hardware()
+      try:
+        return with_retry(self.hardware.read_all_sensors)
+      except AttributeError:
+        # legacy server
+        return {"pms":   with_retry(self.hardware.read_PMs),
+                "temps": with_retry(self.hardware.read_temp)}
+    else:
+      return {"pms": self.read_PMs(), "temps": self.read_temps()}
+
   @support.test.auto_test(returns=list)
   def read_PMs(self):
     if self.hardware:
-      self.hardware._pyroClaimOwnership()
-      return self.hardware.read_PMs()
+      return self.read_all()["pms"]
     else:
       return [(i+1, str(datetime.datetime.utcnow()), random.random()) for i in range(4)]
 
   @support.test.auto_test(returns=dict)
   def read_temps(self):
     if self.hardware:
-      self.hardware._pyroClaimOwnership()
-      return self.hardware.read_temp()
+      return self.read_all()["temps"]
     else:
       return {"load1": 300*random.random(),
               "12K":15*random.random(),
@@ -285,6 +550,8 @@ class K_4ch(FE.FrontEnd):
   def Tsys_vacuum(self, beam=1, pol="R", mode=None, elevation=90):
     """
     """
+    if elevation in _TSYS_ELEV:
+      return _TSYS_VACUUM[int(elevation)]
     return 36/math.sin(math.pi*elevation/180) # K
 
   class Channel(FE.FrontEnd.Channel):
@@ -301,64 +568,75 @@ class K_4ch(FE.FrontEnd):
       parent  - front-end to which this belongs
     """
     def __init__(self, parent, name, inputs=None, output_names=None,
-                 signal=None, active=True):
+                 signal=None, active=True, batch=None):
       """
+      @param batch : if given, hardware commands are added to it
+      @type  batch : Pyro5.api.BatchProxy
       """
-      mylogger = logging.getLogger(parent.logger.name+".Channel")
+      mylogger = parent._channel_logger
       self.name = name
       self.number = int(name[-1])-1
+      # this feed's option codes
+      self._retract_op = 13+2*self.number
+      self._insert_op = 14+2*self.number
+      self._bias_on_op = 25+2*self.number
+      self._bias_off_op = 26+2*self.number
       self.parent = parent
       self.hardware = self.parent.hardware
       mylogger.debug(" initializing for %s", self)
       FE.FrontEnd.Channel.__init__(self, parent, name, inputs=inputs,
                                   output_names=output_names, active=active)
       self.logger = mylogger
-      self.logger.debug(" %s inputs: %s", self, str(inputs))
+      self.logger.debug(" %s inputs: %s", self, inputs)
       self.PM = {}
-      for pol in pols:
-        index = pols.index(pol)
-        ID = output_names[index]
-        self.outputs[ID] = MC.Port(self, ID,
-                                source=inputs[name],
-                                signal=MC.ComplexSignal(signal, name=pol,
-                                pol=pol))
-        self.parent.outputs[ID] = self.outputs[ID]
-        self.PM[pol] = K_4ch.Channel.PowerMeter(self, pol)
-      self.logger.debug(" %s outputs: %s", self, str(self.outputs))
-      self.retract_load()
+      # loop invariants
+      source = inputs[name]
+      outputs = self.outputs
+      parent_outputs = parent.outputs
+      PowerMeter = K_4ch.Channel.PowerMeter
+      for ID, pol in zip(output_names, pols):
+        port = MC.Port(self, ID, source=source,
+                       signal=MC.ComplexSignal(signal, name=pol, pol=pol))
+        outputs[ID] = port
+        parent_outputs[ID] = port
+        self.PM[pol] = PowerMeter(self, pol)
+      self.logger.debug(" %s outputs: %s", self, self.outputs)
+      self.retract_load(batch=batch)
 
     def insert_load(self):
       # invoke option 14 or 16
       if self.hardware:
-        self.hardware._pyroClaimOwnership()
-        self.hardware.set_WBDC(14+2*self.number)
+        self.parent._send_command(self._insert_op)
       self.load_in = True
+      self.parent._invalidate("feed_states", "read_all")
 
-    def retract_load(self):
+    def retract_load(self, batch=None):
       # invoke option 13 or 15
-      if self.hardware:
-        self.hardware._pyroClaimOwnership()
-        self.hardware.set_WBDC(13+2*self.number)
+      if batch:
+        batch.set_WBDC(self._retract_op)
+      elif self.hardware:
+        self.parent._send_command(self._retract_op)
       self.load_in = False
+      self.parent._invalidate("feed_states", "read_all")
 
-    def set_preamp_on(self):
+    def set_preamp_on(self, wait=True):
       # invoke option 25 or 27
       if self.hardware:
-        self.hardware._pyroClaimOwnership()
-        response = self.hardware.set_WBDC(25+2*self.number)
+        response = self.parent._send_command(self._bias_on_op, wait=wait)
       else:
         response = "on"
       self.preamp_on = True
+      self.parent._invalidate("read_all")
       return response
 
-    def set_preamp_off(self):
+    def set_preamp_off(self, wait=True):
       #invoke option 26 or 28
       if self.hardware:
-        self.hardware._pyroClaimOwnership()
-        response = self.hardware.set_WBDC(26+2*self.number)
+        response = self.parent._send_command(self._bias_off_op, wait=wait)
       else:
         response = "off"
       self.preamp_on = False
+      self.parent._invalidate("read_all")
       return response
 
     class PowerMeter(object):
@@ -374,11 +652,13 @@ class K_4ch(FE.FrontEnd):
         """        
         feed = parent
         frontend = feed.parent
-        self.logger = logging.getLogger(feed.logger.name+".PowerMeter")
-        self.logger.debug("__init__: for feed {} of {}".format(
-                                                      feed.name, frontend.name))      
+        self.logger = feed.logger.getChild("PowerMeter")
+        self.frontend = frontend
         self.hardware = frontend.hardware
-        self.logger.debug("__init__: hardware is {}".format(self.hardware))
+        if self.logger.isEnabledFor(logging.DEBUG):
+          self.logger.debug("__init__: for feed {} of {}".format(
+                                                      feed.name, frontend.name))
+          self.logger.debug("__init__: hardware is {}".format(self.hardware))
         if pol.upper() == "P1" or pol.upper() == "E" or pol == 1:
           self.pol = 0
           self.name = "F"+str(feed.number+1)+"P1"
@@ -388,13 +668,14 @@ class K_4ch(FE.FrontEnd):
         else:
           raise RuntimeError("invalid polarization code")
         self.number = 1 + feed.number*2 + self.pol
+        self._opcode = {"W": 390+self.number, "DBM": 400+self.number}
 
       def set_mode(self, mode):
         """
         """
-        self.hardware._pyroClaimOwnership()
-        if mode.upper() == "W":
-          response = self.hardware.set_WBDC(390+self.number)
-        elif mode.lower() == "dbm":
-          response = self.hardware.set_WBDC(400+self.number)
-        return response
+        try:
+          option = self._opcode[mode.upper()]
+        except KeyError:
+          raise RuntimeError("invalid power meter mode: %s" % mode)
+        self.frontend._claim_hardware()
+        return self.hardware.set_WBDC(option)
@@ -31,7 +31,7 @@ from time import sleep, ctime, time
 from datetime import datetime
 try:
 	from pylab import *
-except:
+except ImportError:
 	pass
 import scipy
 import numpy as NP
@@ -39,235 +39,241 @@ import u3
 import re
 import Math
 from threading import Thread
+try:
+  # Python 2 needs the 'futures' backport
+  from concurrent.futures import ThreadPoolExecutor
+except ImportError:
+  ThreadPoolExecutor = None
 import sys
 import logging
 
 module_logger = logging.getLogger(__name__)
 
 class FE_server(Pyro.core.ObjBase, Thread):
-        def __init__(self):
+        logger = module_logger.getChild("FE_server")
+        # power meters: (index, GPIB name, model, description)
+        _PM_CONFIG = [(1, 'pm1', '437B', "Feed 1 Pol 1"),
+                      (2, 'pm2', '437B', "Feed 1 Pol 2"),
+                      (3, 'pm3', '437B', "Feed 2 Pol 1"),
+                      (4, 'pm4', '437B', "Feed 2 Pol 2")]
+        # load temperature sensor for each power meter channel
+        _CH_TO_LOAD = {1: 'load1', 2: 'load1', 3: 'load2', 4: 'load2'}
+        
+        def __init__(self, parallel_pms=False):
+          """
+          @param parallel_pms : serve the power meters from parallel threads;
+                                only if they can be used concurrently
+          """
           Thread.__init__(self)
           Pyro.core.ObjBase.__init__(self)
-          self.logger = logging.getLogger(module_logger.name+".FE_server")
+          self._dispatch = self._build_dispatch()
+          self.sg = None # signal generator; see _get_sg
           #Search for available devices
           available = searchForDevices()
           #Connect to LabJacks
           if len(available) > 0:
             self.lj = self.connect_to_Labjacks(available)
             self.atten = {}
-          if self.lj.has_key(3):
-            self.atten[5] = Attenuator(self.lj[3],6)
+          lj3 = self.lj.get(3)
+          if lj3 is not None:
+            self.atten[5] = Attenuator(lj3,6)
           else:
             self.logger.error("Noise diode attenuator not available")
           #Define Power meters
           self.pm = {}
           self.pm_name = {}
-          try:
-            self.pm[1] = PM('pm1','437B')
-            self.pm_name[1] = "Feed 1 Pol 1"
-          except:              
-            self.logger.error("Could not initialize PM 1")
-          try:
-            self.pm[2] = PM('pm2','437B')
-            self.pm_name[2] = "Feed 1 Pol 2"
-          except:
-            self.logger.error("Could not initialize PM 2")
-          try:
-            self.pm[3] = PM('pm3','437B')
-            self.pm_name[3] = "Feed 2 Pol 1"
-          except:
-            self.logger.error("Could not initialize PM 3")
-            pass
-          try:
-            self.pm[4] = PM('pm4','437B')
-            self.pm_name[4] = "Feed 2 Pol 2"
-          except:
-            self.logger.error("Could not initialize PM 4")
+          for index, address, model, label in self._PM_CONFIG:
+            try:
+              self.pm[index] = PM(address, model)
+              self.pm_name[index] = label
+            except Exception as details:
+              self.logger.error("Could not initialize PM %d: %s", index, details)
+          if parallel_pms and ThreadPoolExecutor is not None:
+            self._pm_pool = ThreadPoolExecutor(max_workers=max(1, len(self.pm)))
+          else:
+            if parallel_pms:
+              self.logger.warning("concurrent.futures not available;"
+                                  " power meters are served serially")
+            self._pm_pool = None
+          self._pm_keys = sorted(self.pm)
+          self.pm_readings = []
+        
+        def _build_dispatch(self):
+          """
+          Map the legacy option codes to their handlers
+          """
+          # every handler is given the time of the set_WBDC call
+          d = {12: lambda now: self._opt_check_feeds(),
+               13: lambda now: self._opt_set_feed(1, False),
+               14: lambda now: self._opt_set_feed(1, True),
+               15: lambda now: self._opt_set_feed(2, False),
+               16: lambda now: self._opt_set_feed(2, True),
+               18: self._opt_Y_factors,
+               20: lambda now: self._opt_toggle_feed(now, 1),
+               21: lambda now: self._opt_toggle_feed(now, 2),
+               22: lambda now: self._opt_ND_state(),
+               23: lambda now: self._opt_set_ND(now, True),
+               24: lambda now: self._opt_set_ND(now, False),
+               25: lambda now: self._opt_preamp_bias(now, 1, True),
+               26: lambda now: self._opt_preamp_bias(now, 1, False),
+               27: lambda now: self._opt_preamp_bias(now, 2, True),
+               28: lambda now: self._opt_preamp_bias(now, 2, False),
+               29: self._opt_minical,
+               31: self._opt_read_temps,
+               32: self._opt_LN2_cal,
+               33: lambda now: self.FElj.LJ.getFeedback(
+                                        u3.BitStateWrite(IONumber = 5, State = 0)),
+               34: lambda now: self.FElj.LJ.getFeedback(
+                                        u3.BitStateWrite(IONumber = 5, State = 1)),
+               35: lambda now: self.FElj.LJ.getFeedback(u3.DAC0_16(255*256)),
+               36: lambda now: self.FElj.LJ.getFeedback(u3.DAC0_16(0))}
+          # power meter modes: 391-394 for W, 401-404 for dBm
+          for ch in range(1, 5):
+            d[390+ch] = (lambda now, ch=ch: self._opt_pm_mode(ch, "W"))
+            d[400+ch] = (lambda now, ch=ch: self._opt_pm_mode(ch, "dBm"))
+          return d
         
         def set_WBDC(self, opt):
-            """
-            """
             self.logger.debug("set_WBDC: called with option %d", opt)
-            if opt == 12:
-              try:
-                text = self.FElj.check_feeds()
-              except Exception, details:
-                self.logger.error("set_WBDC: failed because: %s", details)
-                text = "False"
-              self.logger.debug("set_WBDC: opt 12 returns %s", text)
-              return (text)
-            elif opt == 13:
-              self.logger.debug("set_WBDC: set feed 1 to sky")
-              self.FElj.set_feed(1,sky)
-              return False
-            elif opt == 14:
-              self.logger.debug("set_WBDC: set feed 1 to load")
-              self.FElj.set_feed(1,load)
-              return True
-            elif opt == 15:
-              self.logger.debug("set_WBDC: set feed 2 to sky")
-              self.FElj.set_feed(2,sky)
-              return False
-            elif opt == 16:
-              self.logger.debug("set_WBDC: set feed 2 to load")
-              self.FElj.set_feed(2,load)
-              return True
-            elif opt == 18:
-              self.Yfactors, text = self.FElj.Y_factors(self.pm)
-              text = ("Y-factors at " + ctime(time())+"\n") + (str(self.Yfactors)+"\n")
-              return text
-            elif opt == 20: # does not seem to work
-              return "Feed 1 state changed at " + ctime(time())+"\n"
-              self.FElj.LJ.pulse_bit(0)
-            elif opt == 21: # does not seem to work
-              return "Feed 2 state changed at " + ctime(time())+"\n"
-              self.FElj.LJ.pulse_bit(1)
-            elif opt == 22:
-              if self.FElj.ND_state():
-                text = "off"      
-                return (text)        
-                #conn.send(text)
-              else:
-                text = "on"      
-                return (text)        
-                #conn.send(text)
-            elif opt == 23:
-              self.FElj.set_ND(on)
-              text = "Noise diode turned on at " + ctime(time())
-              return (text)
-            elif opt == 24:
-              self.FElj.set_ND(off)
-              text = "Noise diode turned off at " + ctime(time())
-              return (text)
-            elif opt == 25:
-              self.FElj.preamp_bias(1,True)
-              text = "Preamp 1 bias turned on at " + ctime(time())
-              return (text)
-            elif opt == 26:
-              self.FElj.preamp_bias(1,False)
-              text = "Preamp 1 bias turned off at " + ctime(time())
-              return (text)
-            elif opt == 27:
-              self.FElj.preamp_bias(2,True)
-              text = "Preamp 2 bias turned on at " + ctime(time())
-              return (text)
-            elif opt == 28:
-              self.FElj.preamp_bias(2,False)
-              text = "Preamp 2 bias turned off at " + ctime(time())
-              return( text)
-            elif opt == 29:
-              self.logger.debug("set_WBDC: doing minical")
-              all_gains, all_Tlinear, all_Tquadratic, all_Tnd, all_NonLin, all_x, all_readings = [], [], [], [], [], [], []
-              self.logger.info("Minical data at %s", ctime(time()))
-              #log.write("Minical data at " + ctime(time()) + "\n")
-              cal_data = get_minical.minical_data(self.FElj, self.pm, diag=True)
-              temps = self.FElj.get_temps()
-              cal_data[1]['Tload'] = temps['load1']
-              cal_data[2]['Tload'] = temps['load1']
-              cal_data[3]['Tload'] = temps['load2']
-              cal_data[4]['Tload'] = temps['load2']
-              for key in cal_data.keys():
-                for name in cal_data[key].keys():
-                  text = "Ch."+ str(key) + " " + name + ": " + str(cal_data[key][name])
-                  all_readings.append(text)
-              Tlna = 25
-              Tf = 1
-              Fghz = 22
-              TcorrNDcoupling = 0
-              for key in cal_data.keys():
-                [gains, Tlinear, Tquadratic, Tnd, NonLin] = \
-                  process_minical(cal_data[key], Tlna, Tf, Fghz, TcorrNDcoupling)
-                self.logger.info("set_WBDC: Feed %d",key)
-                self.logger.info("set_WBDC: Gains: %s", str(gains))
-                self.logger.info("set_WBDC: Linear Ts: %s", str(Tlinear))
-                self.logger.info("set_WBDC: Corrected Ts: %s", str(Tquadratic))
-                self.logger.info("set_WBDC: Noise diode T: %s", str(Tnd))
-                self.logger.info("set_WBDC: Non-linearity: %s", str(NonLin))
-                # report the results
-                x = [cal_data[key]['sky'],
-                     cal_data[key]['sky+ND'],
-                     cal_data[key]['load'],
-                     cal_data[key]['load+ND']]
-                all_gains.append(gains)
-                all_Tlinear.append(Tlinear)
-                all_Tquadratic.append(Tquadratic)
-                all_Tnd.append(Tnd)
-                all_NonLin.append(NonLin)
-                all_x.append(x)
-              return all_gains, all_Tlinear, all_Tquadratic, all_Tnd, all_NonLin, all_x, all_readings
-
-            elif opt == 31:
-              if self.lj.has_key(3):
-                text =  str(self.FElj.get_temps())
-                self.logger.info("Front end temperatures at %s\n%s",
-                                 ctime(time()), text)
-                return(text)
-              else:
-                self.logger.error("set_WBDC: Cannot read front end temperatures without front end control")
-            
-            elif opt == 32:
-              self.logger.info("Load/LN2 calibration at %s", ctime(time()))
-              temps = self.FElj.get_temps()
-              Tln2 = 77
-              self.logger.info("Assumed LN2 temperatures: %"+str(Tln2)+"\n")
-              Trec = {}
-              for key in self.Yfactors.keys():
-                if key < 3:
-                  Tload = temps['load1']
-                else:
-                  Tload = temps['load2']
-                R = pow(10., self.Yfactors[key]/10.)
-                Trec[key] = (Tload - R*Tln2)/(R - 1)
-              text = "Trec: "+str(Trec)
-              self.logger.debug("set_WBDC: %s", text)
-              return text
-            elif opt == 33:
-              self.FElj.LJ.getFeedback(u3.BitStateWrite(IONumber = 5, State = 0))
-            elif opt == 34:
-              self.FElj.LJ.getFeedback(u3.BitStateWrite(IONumber = 5, State = 1))
-            elif opt == 35:
-              self.FElj.LJ.getFeedback(self.FElj.LJ.getFeedback(u3.DAC0_16(255*256)))
-            elif opt == 36:
-              self.FElj.LJ.getFeedback(self.FElj.LJ.getFeedback(u3.DAC0_16(0)))
-            elif opt == 391:
-              self.pm[1].set_mode("W")
-              return "PM1 mode set to W"
-
-            elif opt == 392:
-              self.pm[2].set_mode("W")
-              return "PM2 mode set to W"
-
-            elif opt == 393:
-              self.pm[3].set_mode("W")
-              return "PM1 mode set to W"
-
-            elif opt == 394:
-              self.pm[4].set_mode("W")
-              return "PM4 mode set to W"
-
-            elif opt == 401:
-              self.pm[1].set_mode("dBm")
-              return "PM1 mode set to dBm"
-
-            elif opt == 402:
-              self.pm[2].set_mode("dBm")
-              return "PM2 mode set to dBm"
-
-            elif opt == 403:
-              self.pm[3].set_mode("dBm")
-              return "PM3 mode set to dBm"
-
-            elif opt == 404:
-              self.pm[4].set_mode("dBm")
-              return "PM4 mode set to dBm"
-            else:
+            # one timestamp for everything reported by this call
+            now = ctime(time())
+            handler = self._dispatch.get(opt)
+            if handler is None:
               self.logger.error("set_WBDC: option %d not implemented", opt)
+              return None
+            return handler(now)
+        
+        def _opt_check_feeds(self):
+          try:
+            text = self.FElj.check_feeds()
+          except Exception as details:
+            self.logger.error("set_WBDC: failed because: %s", details)
+            text = "False"
+          self.logger.debug("set_WBDC: opt 12 returns %s", text)
+          return (text)
+        
+        def _opt_set_feed(self, feed, to_load):
+          if to_load:
+            self.logger.debug("set_WBDC: set feed %d to load", feed)
+            self.FElj.set_feed(feed, load)
+          else:
+            self.logger.debug("set_WBDC: set feed %d to sky", feed)
+            self.FElj.set_feed(feed, sky)
+          return to_load
+        
+        def _opt_Y_factors(self, now):
+          self.Yfactors, text = self.FElj.Y_factors(self.pm)
+          text = "Y-factors at %s\n%s\n" % (now, self.Yfactors)
+          return text
+        
+        def _opt_toggle_feed(self, now, feed):
+          # does not seem to work; the bit is never pulsed
+          return "Feed %d state changed at %s\n" % (feed, now)
+        
+        def _opt_ND_state(self):
+          if self.FElj.ND_state():
+            return "off"
+          else:
+            return "on"
+        
+        def _opt_set_ND(self, now, turn_on):
+          if turn_on:
+            self.FElj.set_ND(on)
+            return "Noise diode turned on at " + now
+          else:
+            self.FElj.set_ND(off)
+            return "Noise diode turned off at " + now
+        
+        def _opt_preamp_bias(self, now, amp, state):
+          self.FElj.preamp_bias(amp, state)
+          if state:
+            return "Preamp %d bias turned on at %s" % (amp, now)
+          else:
+            return "Preamp %d bias turned off at %s" % (amp, now)
+        
+        def _opt_minical(self, now):
+          self.logger.debug("set_WBDC: doing minical")
+          all_gains, all_Tlinear, all_Tquadratic, all_Tnd, all_NonLin, all_x, all_readings = [], [], [], [], [], [], []
+          self.logger.info("Minical data at %s", now)
+          #log.write("Minical data at " + ctime(time()) + "\n")
+          cal_data = get_minical.minical_data(self.FElj, self.pm, diag=True)
+          temps = self.FElj.get_temps()
+          channels = sorted(cal_data)
+          for key in channels:
+            cal_data[key]['Tload'] = temps[self._CH_TO_LOAD[key]]
+          for key in channels:
+            for name in cal_data[key].keys():
+              all_readings.append("Ch.%s %s: %s" % (key, name, cal_data[key][name]))
+          # constant over the channels
+          Tlna = 25
+          Tf = 1
+          Fghz = 22
+          TcorrNDcoupling = 0
+          for key in channels:
+            [gains, Tlinear, Tquadratic, Tnd, NonLin] = \
+              process_minical(cal_data[key], Tlna, Tf, Fghz, TcorrNDcoupling)
+            if self.logger.isEnabledFor(logging.INFO):
+              self.logger.info("set_WBDC: Feed %d",key)
+              self.logger.info("set_WBDC: Gains: %s", gains)
+              self.logger.info("set_WBDC: Linear Ts: %s", Tlinear)
+              self.logger.info("set_WBDC: Corrected Ts: %s", Tquadratic)
+              self.logger.info("set_WBDC: Noise diode T: %s", Tnd)
+              self.logger.info("set_WBDC: Non-linearity: %s", NonLin)
+            # report the results
+            x = [cal_data[key]['sky'],
+                 cal_data[key]['sky+ND'],
+                 cal_data[key]['load'],
+                 cal_data[key]['load+ND']]
+            all_gains.append(gains)
+            all_Tlinear.append(Tlinear)
+            all_Tquadratic.append(Tquadratic)
+            all_Tnd.append(Tnd)
+            all_NonLin.append(NonLin)
+            all_x.append(x)
+          return all_gains, all_Tlinear, all_Tquadratic, all_Tnd, all_NonLin, all_x, all_readings
+        
+        def _opt_read_temps(self, now):
+          if 3 in self.lj:
+            text =  str(self.FElj.get_temps())
+            self.logger.info("Front end temperatures at %s\n%s",
+                             now, text)
+            return(text)
+          else:
+            self.logger.error("set_WBDC: Cannot read front end temperatures without front end control")
+        
+        def _opt_LN2_cal(self, now):
+          self.logger.info("Load/LN2 calibration at %s", now)
+          temps = self.FElj.get_temps()
+          Tln2 = 77
+          self.logger.info("Assumed LN2 temperature: %s K", Tln2)
+          Trec = {}
+          for key in self.Yfactors.keys():
+            Tload = temps[self._CH_TO_LOAD[key]]
+            R = pow(10., self.Yfactors[key]/10.)
+            Trec[key] = (Tload - R*Tln2)/(R - 1)
+          self.logger.debug("set_WBDC: Trec: %s", Trec)
+          return "Trec: %s" % Trec
+        
+        def _opt_pm_mode(self, ch, mode):
+          self.pm[ch].set_mode(mode)
+          return "PM%d mode set to %s" % (ch, mode)
               
-        def siggen_controls(self, opt, freq, amp):
+        def _get_sg(self):
+          """
+          Signal generator, opened on first use
+          """
+          if self.sg is None:
             try:
               self.sg = SG('SGen_8673g')
-            except:
-              self.logger.error("siggen_controls: Could not initialize Signal Generator")
+            except Exception as details:
+              self.logger.error(
+                "siggen_controls: Could not initialize Signal Generator: %s",
+                details)
+          return self.sg
+        
+        def siggen_controls(self, opt, freq, amp):
+            if self._get_sg() is None:
+              return "Rejected"
             #54 - Reset Signal Generator
             if opt == 1:
               self.sg.init()
@@ -285,7 +291,9 @@ class FE_server(Pyro.core.ObjBase, Thread):
               try:
                 self.sg.power_off()
                 return "Completed"
-              except:
+              except Exception as details:
+                self.logger.error("siggen_controls: power off failed: %s",
+                                  details)
                 return "Rejected"
         
             #57 - Turn Signal Generator On
@@ -295,7 +303,9 @@ class FE_server(Pyro.core.ObjBase, Thread):
                 self.sg.set_freq(freq)
                 self.sg.set_ampl(amp)
                 return "Completed"
-              except:
+              except Exception as details:
+                self.logger.error("siggen_controls: power on failed: %s",
+                                  details)
                 return "Rejected"
  
         def connect_to_Labjacks(self, available):
@@ -311,31 +321,54 @@ class FE_server(Pyro.core.ObjBase, Thread):
             self.lj[LJ].name = U3name[str(self.lj[LJ].serial)]
             self.logger.debug("connect_to_labjack: %s %s",
                               self.lj[LJ].localID, self.lj[LJ].name)
-          if self.lj.has_key(3):
-            self.FElj = FE(self.lj[3])
+          lj3 = self.lj.get(3)
+          if lj3 is not None:
+            self.FElj = FE(lj3)
           else:
             self.logger.warning("connect_to_Labjacks: Front end LabJack is not available")
           return self.lj
         
+        def _pm_map(self, func, items):
+          """
+          Apply func to each item, in parallel if there is a power meter pool
+          """
+          if self._pm_pool is None:
+            return [func(item) for item in items]
+          return list(self._pm_pool.map(func, items))
+        
         def init_pms(self):
-          for key in self.pm.keys():
-            self.pm.init()
+          self._pm_map(lambda pm: pm.init(), self.pm.values())
           
         def read_pms(self):
-          sys.stdout.flush()
-          self.pm_readings = []
-          for key in self.pm.keys():
-            #Get readings every 1 sec.
-            try:
-              readings = NP.mean(NP.array(self.pm[key].get_readings(1)[0]))
-            except Exception, details:
-              self.logger.error("read_pms: failed: %s", details)
-            try:
-              self.pm_readings.append( (key, ctime(time()), readings) )
-            except Exception, details:
-              self.logger.error("read_pms: appending failed: %s", details)
-          #print self.pm_readings
-          return self.pm_readings
+          """
+          Average of one second of readings from each power meter
+
+          Returns a list of (PM number, time, reading) with NaN for a power
+          meter which could not be read.
+          """
+          timestamp = ctime(time())
+          averages = self._pm_map(self._pm_average, self._pm_keys)
+          readings = [(key, timestamp, float(average))
+                      for key, average in zip(self._pm_keys, averages)]
+          self.pm_readings = readings
+          return readings
+        
+        def _pm_average(self, key):
+          """
+          Average of one second of readings from power meter ``key``
+          """
+          try:
+            return NP.mean(NP.fromiter(self.pm[key].get_readings(1)[0],
+                                       dtype=float))
+          except Exception as details:
+            self.logger.error("read_pms: PM %d failed: %s", key, details)
+            return NP.nan
+        
+        def read_all_sensors(self):
+          """
+          Read the power meters and the rx temperatures in one call
+          """
+          return {"pms": self.read_pms(), "temps": self.read_temp()}
         
         def calculate_Tsys(self):
           """
@@ -382,7 +415,7 @@ def main():
    locator = Pyro.naming.NameServerLocator()
    try:
      ns = locator.getNS(host='crux.cdscc.fltops.jpl.nasa.gov')
-   except NamingError,details:
+   except NamingError as details:
      mylogger.error(
        """Pyro nameserver task not found.
           Is the terminal at least 85 chars wide?
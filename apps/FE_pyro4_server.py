@@ -1,6 +1,16 @@
 # -*- coding: utf-8 -*-
+import argparse
+import atexit
+import concurrent.futures
+import functools
 import logging
+import logging.handlers
+import os
+import queue
+import threading
+import time
 
+import Pyro4
 # the Observatory package is obsolete
 from Observatory import FrontEnd
 from Observatory.WBDC import Attenuator
@@ -11,38 +21,133 @@ import Electronics.Interfaces.LabJack as LabJack
 
 module_logger = logging.getLogger(__name__)
 
+def _requires_ready(method):
+    """
+    Make a method wait for the server's hardware bring-up to finish
+
+    The method fails with RuntimeError if no front end is connected, as in
+    a simulated server or after a failed bring-up.
+    """
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        if not self._ready.wait(timeout=5.0):
+            raise RuntimeError("%s: front end hardware is not ready"
+                               % method.__name__)
+        if self.frontend is None:
+            raise RuntimeError("%s: no front end connected%s"
+                               % (method.__name__,
+                                  " (simulated server)" if self.simulated
+                                  else ""))
+        return method(self, *args, **kwargs)
+    return wrapper
+
 @config.expose
 class FEServer(Pyro4Server):
     """
     Server that controls the Front End.
     """
-    def __init__(self, logger=None, **kwargs):
+    # Pyro4Server instances keep a __dict__ for the base class state
+    __slots__ = ('lj', 'frontend', 'atten', '_temp_cache', '_temp_ttl',
+                 '_temp_lock', '_lj_lock', '_ready', 'simulated')
+    _device_cache = None # result of LabJack.searchForDevices
+    # front end states
+    _SKY = FrontEnd.sky
+    _LOAD = FrontEnd.load
+    _ND_ON = FrontEnd.on
+    _ND_OFF = FrontEnd.off
+    _STATE_MAP = {'sky': _SKY, 'load': _LOAD}
+
+    def __init__(self, logger=None, simulated=False, **kwargs):
+        """
+        Args:
+            simulated (bool): do not look for or connect to LabJacks
+        """
         if not logger:
             logger = logging.getLogger(module_logger.name+".FEServer")
         Pyro4Server.__init__(self, "FE", logger=logger, **kwargs)
         self.lj = None # labjacks
         self.frontend = None # Front End
         self.atten = {}
+        self._temp_cache = (0.0, None) # (monotonic time, temperatures)
+        self._temp_ttl = 1.0 # sec
+        self._temp_lock = threading.Lock()
+        # one hardware setter or apply_state batch at a time
+        self._lj_lock = threading.RLock()
+        self._ready = threading.Event() # set when hardware bring-up ends
+        self.simulated = simulated
+        if simulated:
+            self.logger.info("__init__: simulated; no LabJacks used")
+            self._ready.set()
+            return
+        # the server can be launched while the LabJacks are opened
+        threading.Thread(target=self._bringup, name="FE_bringup",
+                         daemon=True).start()
+
+    def _bringup(self):
+        """
+        Find and open the LabJacks, front end and noise diode attenuator
+        """
+        try:
+            self._connect_hardware()
+        except Exception:
+            self.logger.exception("_bringup: hardware bring-up failed")
+        finally:
+            self._ready.set()
+
+    def _connect_hardware(self):
+        """
+        Checks for each device before opening it
+
+        Missing hardware is reported without a traceback; only a device
+        which is present but fails to open gets one.  A failure with one
+        device does not stop the other from being tried.
+        """
+        import u3 # LabJackPython is not needed by a simulated server
+        expected = (OSError, KeyError, u3.LabJackException)
         # Find available devices
-        self.logger.debug("__init__: Finding LabJack devices.")
-        available = LabJack.searchForDevices()
-        self.logger.debug("__init__: available: {}".format(available))
+        available = self.find_devices()
+        self.logger.debug("_connect_hardware: available: %s", available)
+        if not available:
+            self.logger.debug("_connect_hardware: no LabJacks found")
+            return
         # Connect to LabJacks
-        if len(available) > 0:
-            self.logger.debug("__init__: Connecting to LabJacks.")
-            self.lj = self.connect_to_Labjacks(available)
-            self.atten = {}
-            if 3 in self.lj:
-                try:
-                    self.frontend = FrontEnd.FE(self.lj[3])
-                except:
-                    self.logger.error("Couldn't connect to Front end", exc_info=True)
-                try:
-                    self.atten[5] = Attenuator(self.lj[3], 6)
-                except:
-                    self.logger.error("Couldn't connect to Noise Diode", exc_info=True)
-            else:
-                self.logger.error("Front end and noise diode attenuator not available")
+        self.logger.debug("_connect_hardware: Connecting to LabJacks.")
+        self.lj = self.connect_to_Labjacks(available)
+        fe_lj = self.lj.get(3)
+        if fe_lj is None:
+            self.logger.error("Front end and noise diode attenuator not available")
+            return
+        try:
+            self.frontend = FrontEnd.FE(fe_lj)
+        except expected:
+            self.logger.error("Couldn't connect to Front end", exc_info=True)
+        except Exception:
+            self.logger.exception("Unexpected error connecting to Front end")
+        try:
+            self.atten[5] = Attenuator(fe_lj, 6)
+        except expected:
+            self.logger.error("Couldn't connect to Noise Diode", exc_info=True)
+        except Exception:
+            self.logger.exception("Unexpected error connecting to Noise Diode")
+
+    @classmethod
+    def find_devices(cls):
+        """
+        LabJacks on the USB bus, found on first use and then remembered
+        Returns:
+            dict
+        """
+        if cls._device_cache is None:
+            module_logger.debug("find_devices: Finding LabJack devices.")
+            cls._device_cache = LabJack.searchForDevices()
+        return cls._device_cache
+
+    @classmethod
+    def refresh_devices(cls):
+        """
+        Forget the remembered LabJacks so the next search scans the bus
+        """
+        cls._device_cache = None
 
     def connect_to_Labjacks(self, available):
         """
@@ -53,56 +158,86 @@ class FEServer(Pyro4Server):
             dict
         """
         #          global WBDCdigLJ, WBDCattLJ, FElj
-        for LJ in available.keys():
-            self.logger.debug("connect_to_Labjacks: Serial:{}, local ID: {}".format(LJ, available[LJ]['localId']))
+        if self.logger.isEnabledFor(logging.DEBUG):
+            for LJ in available.keys():
+                self.logger.debug("connect_to_Labjacks: Serial:%s, local ID: %s",
+                                  LJ, available[LJ]['localId'])
         self.lj = LabJack.connect_to_U3s()
-        self.logger.info("connect_to_Labjacks: {} LabJacks connected".format(len(self.lj)))
+        self.logger.info("connect_to_Labjacks: %d LabJacks connected", len(self.lj))
         #          WBDC.init_WBDC_U3s(self.lj)
         for LJ in self.lj.keys():
-            self.logger.debug("connect_to_Labjacks: Checking name for LabJack {}".format(LJ))
+            self.logger.debug("connect_to_Labjacks: Checking name for LabJack %s", LJ)
             self.lj[LJ].name = LabJack.U3name[str(self.lj[LJ].serial)]
-            self.logger.debug("connect_to_labjack: {} {}".format(self.lj[LJ].localID, self.lj[LJ].name))
+            self.logger.debug("connect_to_labjack: %s %s",
+                              self.lj[LJ].localID, self.lj[LJ].name)
         return self.lj
 
+    @_requires_ready
     def read_temp(self):
         """
         Read rx temperatures
+
+        A reading less than the cache lifetime old is returned without
+        reading the LabJack again.
         """
-        temp_dict = self.frontend.get_temps()
+        now = time.monotonic()
+        with self._temp_lock:
+            then, temp_dict = self._temp_cache
+            if temp_dict is not None and now - then < self._temp_ttl:
+                return temp_dict
+        # the LabJack is shared with the setters
+        with self._lj_lock:
+            temp_dict = self.frontend.get_temps()
+        with self._temp_lock:
+            self._temp_cache = (now, temp_dict)
         return temp_dict
 
+    def set_temp_ttl(self, seconds):
+        """
+        Set the lifetime of cached temperatures; 0 disables the cache
+        Args:
+            seconds (float):
+        """
+        with self._temp_lock:
+            self._temp_ttl = float(seconds)
+            self._temp_cache = (0.0, None)
+
+    @_requires_ready
     def set_feed(self, feed, state):
         """
         Set the feed to either 1 or 2.
         Args:
             feed (int): 1 or 2
-            state (str): 'load' or 'sky'
+            state (str): 'load' or 'sky'; other case and surrounding
+                blanks are accepted but lower case is looked up first
         Returns:
             None
         """
-        if state.strip().lower() == 'sky':
-            state = FrontEnd.sky
-        elif state.strip().lower() == 'load':
-            state = FrontEnd.load
-        self.frontend.set_feed(feed, state)
+        mapped = self._STATE_MAP.get(state)
+        if mapped is None:
+            mapped = self._STATE_MAP.get(state.strip().lower(), state)
+        with self._lj_lock:
+            self.frontend.set_feed(feed, mapped)
 
+    @_requires_ready
     def get_ND_state(self):
         """Return current state of Noise diode"""
-        return self.frontend.ND_state()
+        with self._lj_lock:
+            return self.frontend.ND_state()
 
+    @_requires_ready
     def set_ND_state(self, flag):
         """
         Set the noise diode state
         Args:
             flag (bool): Turn on or off. True is on, False is off.
         """
-        if flag:
-            state = FrontEnd.on
-        else:
-            state = FrontEnd.off
-        self.logger.debug("Setting ND state to {}".format(state))
-        self.frontend.set_ND(state)
+        state = self._ND_ON if flag else self._ND_OFF
+        self.logger.debug("Setting ND state to %s", state)
+        with self._lj_lock:
+            self.frontend.set_ND(state)
 
+    @_requires_ready
     def set_preamp_bias(self, feed, state):
         """
         Set the preamp bias state
@@ -112,13 +247,49 @@ class FEServer(Pyro4Server):
         Returns:
             None
         """
-        self.logger.debug("Setting preamp bias for feed {} to {}".format(feed, state))
-        self.frontend.preamp_bias(feed, state)
+        self.logger.debug("Setting preamp bias for feed %s to %s", feed, state)
+        with self._lj_lock:
+            self.frontend.preamp_bias(feed, state)
+
+    @_requires_ready
+    def apply_state(self, ops):
+        """
+        Apply several settings in one call
+        
+        The settings are always applied in the order feeds, preamps,
+        attenuators, noise diode, whatever the order of the keys.
+        Args:
+            ops (dict): any of
+                "feed": {feed: 'sky' or 'load'},
+                "preamp": {feed: bool},
+                "atten": {attenuator: dB},
+                "nd": bool
+        Returns:
+            None
+        """
+        with self._lj_lock:
+            for feed, state in ops.get("feed", {}).items():
+                self.set_feed(int(feed), state)
+            for feed, state in ops.get("preamp", {}).items():
+                self.set_preamp_bias(int(feed), state)
+            for key, atten in ops.get("atten", {}).items():
+                self.atten[int(key)].set_atten(atten)
+            if "nd" in ops:
+                self.set_ND_state(ops["nd"])
+
+    def read_all(self):
+        """
+        Read the temperatures and the noise diode state in one call
+        Returns:
+            dict
+        """
+        return {"temps": self.read_temp(),
+                "nd": self.get_ND_state()}
 
     # def initialize_signal_generator(self):
     #     try:
     #         self.sg = SG('SGen_8673g')
-    #     except:
+    #     except Exception:
     #         self.logger.error("siggen_controls: Could not initialize Signal Generator")
     #     # 54 - Reset Signal Generator
     #     if opt == 1:
@@ -137,7 +308,7 @@ class FEServer(Pyro4Server):
     #         try:
     #             self.sg.power_off()
     #             return "Completed"
-    #         except:
+    #         except Exception:
     #             return "Rejected"
     #
     #     # 57 - Turn Signal Generator On
@@ -147,10 +318,62 @@ class FEServer(Pyro4Server):
     #             self.sg.set_freq(freq)
     #             self.sg.set_ampl(amp)
     #             return "Completed"
-    #         except:
+    #         except Exception:
     #             return "Rejected"
+class FEBatchClient(object):
+    """
+    Client which submits FEServer.apply_state batches without waiting
+
+    With the default single worker the batches reach the server in the
+    order submitted.  More workers only make sense for batches which do
+    not depend on each other.
+    """
+    def __init__(self, uri, max_workers=1):
+        """
+        Args:
+            uri (str or Pyro4.URI): the FEServer
+            max_workers (int): batches in flight at once
+        """
+        self._uri = uri
+        self._local = threading.local() # one proxy per worker thread
+        self._proxies = [] # all of them, for close()
+        self._proxies_lock = threading.Lock()
+        self._pool = concurrent.futures.ThreadPoolExecutor(
+                                                   max_workers=max_workers)
+
+    def _apply(self, ops):
+        proxy = getattr(self._local, "proxy", None)
+        if proxy is None:
+            proxy = self._local.proxy = Pyro4.Proxy(self._uri)
+            with self._proxies_lock:
+                self._proxies.append(proxy)
+        return proxy.apply_state(ops)
+
+    def submit_async(self, batches):
+        """
+        Queue apply_state calls
+        Args:
+            batches (list of dict): see FEServer.apply_state
+        Returns:
+            list of concurrent.futures.Future
+        """
+        return [self._pool.submit(self._apply, ops) for ops in batches]
+
+    def close(self):
+        """
+        Wait for the queued batches, stop the workers and release their
+        connections
+        """
+        self._pool.shutdown(wait=True)
+        with self._proxies_lock:
+            proxies, self._proxies = self._proxies, []
+        for proxy in proxies:
+            proxy._pyroRelease()
+
+@functools.lru_cache(maxsize=1)
 def simple_parse_args():
     """
+    The argument parser, built on the first call only
     """
     parser = argparse.ArgumentParser(description="Start WBDC-2 Pyro4 server")
 
@@ -181,14 +404,65 @@ def simple_parse_args():
 
     return parser
 
+class _DroppingQueueHandler(logging.handlers.QueueHandler):
+    """
+    QueueHandler which drops, and counts, records when its queue is full
+
+    The standard handler reports every record it cannot queue with a
+    traceback on stderr, from the thread that logged it.
+    """
+    def __init__(self, log_queue):
+        logging.handlers.QueueHandler.__init__(self, log_queue)
+        self.dropped = 0
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            # emit() is called with the handler lock held
+            self.dropped += 1
+
+_log_listener = None # background writer started by setup_logging
+_log_queue_handler = None
+
+def _stop_log_listener():
+    """
+    Stop the log file writer, flushing queued records, and note any drops
+    """
+    global _log_listener, _log_queue_handler
+    if _log_listener is None:
+        return
+    _log_listener.stop()
+    if _log_queue_handler.dropped:
+        record = logging.makeLogRecord(
+            {"name": module_logger.name, "levelno": logging.WARNING,
+             "levelname": "WARNING",
+             "msg": "%d log records dropped because the log queue was full",
+             "args": (_log_queue_handler.dropped,)})
+        for handler in _log_listener.handlers:
+            handler.handle(record)
+    for handler in _log_listener.handlers:
+        handler.close()
+    _log_listener = None
+    _log_queue_handler = None
+
+atexit.register(_stop_log_listener)
+
 def setup_logging(logfile, level):
     """
     Setup logging.
+
+    The log file is written by a background thread so that logging from
+    the Pyro request threads does not wait on the disk.  If that thread
+    falls 10000 records behind, further records are dropped and counted.
+    Calling this again replaces the previous log file writer.
     Args:
         logfile (str): The path to the logfile to use.
     Returns:
         None
     """
+    global _log_listener, _log_queue_handler
+    _stop_log_listener()
     logging.basicConfig(level=level)
     s_formatter = logging.Formatter('%(levelname)s:%(name)s:%(message)s')
     f_formatter = logging.Formatter('%(levelname)s:%(asctime)s:%(name)s:%(message)s')
@@ -196,6 +470,13 @@ def setup_logging(logfile, level):
     fh = logging.FileHandler(logfile)
     fh.setLevel(logging.DEBUG)
     fh.setFormatter(f_formatter)
+    log_queue = queue.Queue(maxsize=10000)
+    qh = _DroppingQueueHandler(log_queue)
+    listener = logging.handlers.QueueListener(log_queue, fh,
+                                              respect_handler_level=True)
+    listener.start()
+    _log_listener = listener
+    _log_queue_handler = qh
 
     sh = logging.StreamHandler()
     sh.setLevel(level)
@@ -203,7 +484,7 @@ def setup_logging(logfile, level):
 
     root_logger = logging.getLogger('')
     root_logger.handlers = []
-    root_logger.addHandler(fh)
+    root_logger.addHandler(qh)
     root_logger.addHandler(sh)
 
 if __name__ == "__main__":
@@ -226,9 +507,10 @@ if __name__ == "__main__":
     logger = logging.getLogger(name)
     logger.setLevel(loglevel)
 
-    fe_server = FEServer(logger=logger, logfile=logfile)
+    fe_server = FEServer(logger=logger, simulated=parsed.simulated,
+                         logfile=logfile)
     fe_server.launch_server("crux", ns_port=50000)
     # try:
     #     fe_server.launch_server(remote_server_name='crux.cdscc.fltops.jpl.nasa.gov', ns_port=50000)
-    # except:
+    # except Exception:
     #     fe_server.launch_server(remote_server_name='crux.cdscc.jpl.nasa.gov', ns_port=50000)
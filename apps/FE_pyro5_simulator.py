@@ -33,10 +33,14 @@ The amplifier bias can be digitally switched off and on.
 
 """
 # -*- coding: utf-8 -*-
+import argparse
+import functools
 import logging
+import socket
+
+import Pyro5.api
 
 from MonitorControl.FrontEnd import FrontEnd
-from Observatory.WBDC import Attenuator
 
 from local_dirs import log_dir
 import support
@@ -46,112 +50,130 @@ from support.pyro import Pyro5Server
   
 module_logger = logging.getLogger(__name__)
 
-class K_FE(support.PropertiedClass):
+# simulated component states
+_STATE_MAP = {'sky': 0, 'load': 1} # ambient load out, in
+_ND_MAP = (0, 1) # noise diode off, on
+# nominal physical temperatures (K)
+_TEMPS = {"load1": 295.0, "load2": 295.0, "12K": 15.0, "70K": 80.0}
+
+class AmbientLoad(object):
   """
+  Waveguide load attached behind feed
   """
+  __slots__ = ('state',)
+  
   def __init__(self):
     """
+    assign an ambient load to parent Feed
     """
-    self.feed = {1: Feed(1), 2: Feed(2)}
-    self.nd = NoiseDiode()
-                 2: {"E": Channel(beam=2, pol="E"),
-                     "H": Channel(beam=2, pol="H")}}
+    self.state = 0 # out
+
+  def set_state(self, state):
+    """
+    """
+    self.state = state
+
+  def get_state(self):
+    """
+    """
+    return self.state
+
+class Channel(object):
+  """
+  Output for one polarization from an orthomode
+  """
+  __slots__ = ('pol',)
   
-  class Feed(object):
-    """
-    Feed horn and associated waveguide components
-    """
-    def __init__(self, number):
-      """
-      Assign Feed to a beam defined by the feed position
-      """
-      self.number = number # number
-      self.position = [0, -0.012, +0.012][number] # inch
-      self.name = [None, "minus", "plus"][number]
-      self.load = AmbientLoad()
-      self.chan = {"E": Channel(pol="E"), "H": Channel(pol="H")}
-
-    class AmbientLoad(object):
-      """
-      Waveguide load attached behind feed
-      """
-      def __init__(self):
-        """
-        assign an ambient load to parent Feed
-        """
-        self.state = 0 # out
-    
-      def set_state(self, state):
-        """
-        """
-        self.state = state
-    
-      def get_state(self):
-        """
-        """
-        return self.state
-    
-    class Channel(object):
-      """
-      Output for one polarization from an orthomode
-      """
-      def __init__(self, pol):
-        """
-        assign polarization
-        """
-        self.pol = pol
-      
-      def read_PM(self):
-        """
-        read power meter attached to channel
-        """
-        pass
+  def __init__(self, pol):
+    """
+    assign polarization
+    """
+    self.pol = pol
   
-  class NoiseDiode(object):
+  def read_PM(self):
     """
-    Noise diode which injects noise power into all channels
+    read power meter attached to channel
     """
-    def __init__(self):
-      """
-      """
-      self.state = 0 # off
-    
-    def set_state(self, state):
-      """
-      """
-      self.state = state
-    
-    def get_state(self):
-      """
-      """
-      return self.state
-    
-    class Attenuator(object):
-      """
-      PIN diode attenuator for noise diode signal
-      """
-      def __init__(self, atten=0):
-        """
-        initialize attenuator at 0 dB
-        """
-        self.atten = atten
-      
-      def set_atten(self, atten):
-        """
-        """
-        self.atten = atten
-      
-      def get_atten(self):
-        """
-        """
-        return self.atten
-      
+    pass
+
+class Feed(object):
+  """
+  Feed horn and associated waveguide components
+  """
+  __slots__ = ('number', 'position', 'name', 'load', 'chan', 'preamp')
+  
+  def __init__(self, number):
+    """
+    Assign Feed to a beam defined by the feed position
+    """
+    self.number = number # number
+    self.position = [0, -0.012, +0.012][number] # inch
+    self.name = [None, "minus", "plus"][number]
+    self.load = AmbientLoad()
+    self.chan = {"E": Channel(pol="E"), "H": Channel(pol="H")}
+    self.preamp = True # bias on
+
+class Attenuator(object):
+  """
+  PIN diode attenuator for noise diode signal
+  """
+  __slots__ = ('atten',)
+  
+  def __init__(self, atten=0):
+    """
+    initialize attenuator at 0 dB
+    """
+    self.atten = atten
+  
+  def set_atten(self, atten):
+    """
+    """
+    self.atten = atten
+  
+  def get_atten(self):
+    """
+    """
+    return self.atten
+
+class NoiseDiode(object):
+  """
+  Noise diode which injects noise power into all channels
+  """
+  __slots__ = ('state',)
+  
+  def __init__(self):
+    """
+    """
+    self.state = 0 # off
+  
+  def set_state(self, state):
+    """
+    """
+    self.state = state
+  
+  def get_state(self):
+    """
+    """
+    return self.state
+
+class K_FE(support.PropertiedClass):
+  """
+  """
+  def __init__(self):
+    """
+    """
+    self.feed = {1: Feed(1), 2: Feed(2)}
+    self.nd = NoiseDiode()
+    self.atten = {5: Attenuator()} # noise diode attenuator
   
 @Pyro5.api.expose
 class FEServer(Pyro5Server, K_FE):
     """
     Server that controls the Front End.
     """
+    # apply_state keys, in the order they are applied
+    _APPLY_KEYS = ("feed", "preamp", "atten", "nd")
+
     def __init__(self, logger=None, **kwargs):
         if not logger:
             logger = logging.getLogger(module_logger.name+".FEServer")
@@ -163,19 +185,22 @@ class FEServer(Pyro5Server, K_FE):
         Set the feed to either 1 or 2.
         Args:
             feed (int): 1 or 2
-            state (str): 'load' or 'sky'
+            state (str): 'load' or 'sky'; other case and surrounding
+                blanks are accepted but lower case is looked up first
         Returns:
             None
         """
-        if state.strip().lower() == 'sky':
-            self.load = 0
-        elif state.strip().lower() == 'load':
-            self.load = 1
-        self.frontend.set_feed(feed, state)
+        mapped = _STATE_MAP.get(state)
+        if mapped is None:
+            mapped = _STATE_MAP.get(state.strip().lower())
+        if mapped is None:
+            raise ValueError("feed state must be 'sky' or 'load', not %r"
+                             % state)
+        self.feed[feed].load.set_state(mapped)
 
     def get_ND_state(self):
         """Return current state of Noise diode"""
-        return self.load.get_state()
+        return self.nd.get_state()
 
     def set_ND_state(self, flag):
         """
@@ -183,12 +208,9 @@ class FEServer(Pyro5Server, K_FE):
         Args:
             flag (bool): Turn on or off. True is on, False is off.
         """
-        if flag:
-            state = FrontEnd.on
-        else:
-            state = FrontEnd.off
-        self.logger.debug("Setting ND state to {}".format(state))
-        self.frontend.set_ND(state)
+        state = _ND_MAP[bool(flag)]
+        self.logger.debug("Setting ND state to %s", state)
+        self.nd.set_state(state)
 
     def set_preamp_bias(self, feed, state):
         """
@@ -199,13 +221,56 @@ class FEServer(Pyro5Server, K_FE):
         Returns:
             None
         """
-        self.logger.debug("Setting preamp bias for feed {} to {}".format(feed, state))
-        self.frontend.preamp_bias(feed, state)
+        self.logger.debug("Setting preamp bias for feed %s to %s", feed, state)
+        self.feed[feed].preamp = bool(state)
+
+    def read_temp(self):
+        """
+        Read rx temperatures
+        """
+        return dict(_TEMPS)
+
+    def apply_state(self, ops):
+        """
+        Apply several settings in one call
+
+        Same as the Pyro4 server: the settings are always applied in the
+        order feeds, preamps, attenuators, noise diode.
+        Args:
+            ops (dict): any of
+                "feed": {feed: 'sky' or 'load'},
+                "preamp": {feed: bool},
+                "atten": {attenuator: dB},
+                "nd": bool
+        Returns:
+            None
+        """
+        unknown = set(ops) - set(self._APPLY_KEYS)
+        if unknown:
+            raise ValueError("apply_state: unsupported keys %s; use %s"
+                             % (sorted(unknown), self._APPLY_KEYS))
+        for feed, state in ops.get("feed", {}).items():
+            self.set_feed(int(feed), state)
+        for feed, state in ops.get("preamp", {}).items():
+            self.set_preamp_bias(int(feed), state)
+        for key, atten in ops.get("atten", {}).items():
+            self.atten[int(key)].set_atten(atten)
+        if "nd" in ops:
+            self.set_ND_state(ops["nd"])
+
+    def read_all(self):
+        """
+        Read the temperatures and the noise diode state in one call
+        Returns:
+            dict
+        """
+        return {"temps": self.read_temp(),
+                "nd": self.get_ND_state()}
 
     # def initialize_signal_generator(self):
     #     try:
     #         self.sg = SG('SGen_8673g')
-    #     except:
+    #     except Exception:
     #         self.logger.error("siggen_controls: Could not initialize Signal Generator")
     #     # 54 - Reset Signal Generator
     #     if opt == 1:
@@ -224,7 +289,7 @@ class FEServer(Pyro5Server, K_FE):
     #         try:
     #             self.sg.power_off()
     #             return "Completed"
-    #         except:
+    #         except Exception:
     #             return "Rejected"
     #
     #     # 57 - Turn Signal Generator On
@@ -234,10 +299,12 @@ class FEServer(Pyro5Server, K_FE):
     #             self.sg.set_freq(freq)
     #             self.sg.set_ampl(amp)
     #             return "Completed"
-    #         except:
+    #         except Exception:
     #             return "Rejected"
+@functools.lru_cache(maxsize=1)
 def create_arg_parser():
     """
+    The argument parser, built on the first call only
     """
     parser = argparse.ArgumentParser(description="Start WBDC-2 Pyro4 server")
 
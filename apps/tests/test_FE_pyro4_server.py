@@ -12,34 +12,43 @@ from FE_pyro4_server import FEServer
 
 class TestFEServer(unittest.TestCase):
 
-    isSetup = False
     server = None
     client = None
 
-    def setUp(self):
-        if not self.__class__.isSetup:
-
-            port = Pyro4.socketutil.findProbablyUnusedPort()
-            ns_details = Pyro4.naming.startNS(port=port)
-            ns_thread = threading.Thread(target=ns_details[1].requestLoop)
-            ns_thread.daemon = True
-            ns_thread.start()
-
-            res = pyro4tunneling.util.check_connection(Pyro4.locateNS, kwargs={"port":port})
-            ns = Pyro4.locateNS(port=port)
-
-            name = "FE_pyro4_server"
-            logger = logging.getLogger(name)
-            logger.setLevel(logging.DEBUG)
-            server = FEServer(name, logger=logger)
-            server_thread = server.launch_server(ns_port=port, local=True, threaded=True)
-
-            self.__class__.client = Pyro4.Proxy(ns.lookup(server.name))
-            self.__class__.server = server
-            self.__class__.isSetup = True
-
-        else:
-            pass
+    @classmethod
+    def setUpClass(cls):
+        port = Pyro4.socketutil.findProbablyUnusedPort()
+        ns_details = Pyro4.naming.startNS(port=port)
+        ns_thread = threading.Thread(target=ns_details[1].requestLoop)
+        ns_thread.daemon = True
+        ns_thread.start()
+
+        res = pyro4tunneling.util.check_connection(Pyro4.locateNS, kwargs={"port":port})
+        ns = Pyro4.locateNS(port=port)
+
+        name = "FE_pyro4_server"
+        logger = logging.getLogger(name)
+        logger.setLevel(logging.DEBUG)
+        server = FEServer(logger=logger)
+        server_thread = server.launch_server(ns_port=port, local=True, threaded=True)
+
+        # one proxy, and so one connection, for all the tests
+        cls.client = Pyro4.Proxy(ns.lookup(server.name))
+        cls.server = server
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.client._pyroRelease()
+
+    def test_batched_reads(self):
+        batch = self.__class__.client._pyroBatch()
+        batch.read_temp()
+        batch.get_ND_state()
+        temps, nd_state = tuple(batch())
+        self.assertIsInstance(temps, dict)
+        # the ambient load sensors used for the calibrations
+        self.assertLessEqual({"load1", "load2"}, set(temps))
+        self.assertIn(nd_state, (FEServer._ND_ON, FEServer._ND_OFF))
 
     def test_read_temp(self):
         client = self.__class__.client
@@ -67,6 +76,7 @@ if __name__ == "__main__":
 
     suite_get.addTest(TestFEServer("test_read_temp"))
     suite_get.addTest(TestFEServer("test_get_ND_state"))
+    suite_get.addTest(TestFEServer("test_batched_reads"))
 
     suite_set.addTest(TestFEServer("test_set_feed"))
     suite_set.addTest(TestFEServer("test_set_ND_state"))
@@ -29,35 +29,43 @@ quantities, in dB, are::
 """
 import numpy
 from pylab import *
+try:
+  import pandas
+except ImportError:
+  pandas = None
 
 colors = ['b', 'g', 'r', 'c']
 pols = ['H1', 'H2', 'V1', 'V2']
 
-data = numpy.genfromtxt("K-band - K2 data to Tom-1.csv", delimiter=',', skiprows=7)
-Spar = {}
-Spar[0] = data[:, 1:10] # LNA H1
-Spar[1] = data[:,21:29] # LNA H2
-Spar[2] = data[:,41:49] # LNA V1
-Spar[3] = data[:,61:69] # LNA V2
-Spar[4] = data[:,11:19] # LNA + Post Assembly, H1
-Spar[5] = data[:,31:39] # LNA + Post Assembly, H2
-Spar[6] = data[:,51:59] # LNA + Post Assembly, V1
-Spar[7] = data[:,71:79] # LNA + Post Assembly, V2
+# first column of each dataset: LNA H1, H2, V1, V2, then LNA + Post Assembly
+# H1, H2, V1, V2
+freq_cols = numpy.array([1, 21, 41, 61, 11, 31, 51, 71])
+# only the frequency and S21 (dB) columns are parsed
+datafile = "K-band - K2 data to Tom-1.csv"
+usecols = numpy.concatenate((freq_cols, freq_cols+5))
+if pandas:
+  # C parser; single precision is ample for 0.01 dB data
+  frame = pandas.read_csv(datafile, skiprows=7, header=None, usecols=usecols,
+                          dtype=numpy.float32, engine='c', na_filter=False)
+  # columns are labelled by file position; put them in usecols order
+  data = frame[usecols].to_numpy()
+else:
+  data = numpy.loadtxt(datafile, delimiter=',', skiprows=7, usecols=usecols)
+freq = data[:, :8]/1.e9
+S21 = data[:, 8:]
 
 figure(figsize=(16,6))
 for index in range(4):
   subplot(1,2,1)
-  plot(Spar[index][:,0]/1.e9, Spar[index][:,5],
+  plot(freq[:,index], S21[:,index],
             color=colors[index], label=pols[index])
-  plot(Spar[index+4][:,0]/1.e9, Spar[index+4][:,5], color=colors[index])
+  plot(freq[:,index+4], S21[:,index+4], color=colors[index])
   grid(True)
   xlabel("Frequency (GHz)")
   ylabel("$S_{21}$ (dB)")
   legend(loc="lower center")
   subplot(1,2,2)
-  plot(Spar[index+4][:,0]/1e9,
-       (Spar[index+4][:,5]-Spar[index][:,5]),
-        color=colors[index])
+  plot(freq[:,index+4], S21[:,index+4]-S21[:,index], color=colors[index])
   grid(True)
   xlabel("Frequency (GHz)")
   ylabel("Post Amp Gain (dB)")
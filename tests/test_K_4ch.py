@@ -1,10 +1,14 @@
 import unittest
+import unittest.mock
 import logging
+import threading
+
+import Pyro5.errors
 
 from support.test import auto_test, AutoTestSuite
 from support.logs import setup_logging
 
-from MonitorControl.FrontEnds.Kband import K_4ch
+from MonitorControl.FrontEnds.Kband import K_4ch, with_retry
 
 auto_tester = AutoTestSuite(K_4ch,args=("K",))
 suite, TestK_4ch_factory = auto_tester.create_test_suite(factory=True)
@@ -12,14 +16,79 @@ suite, TestK_4ch_factory = auto_tester.create_test_suite(factory=True)
 class TestK_4ch(TestK_4ch_factory()):
     pass
 
+# front ends connected to hardware, shared by all the tests in this module
+_FE_CACHE = {}
+
+def _get_fe(name):
+    if name not in _FE_CACHE:
+        _FE_CACHE[name] = K_4ch(name, hardware=True)
+    return _FE_CACHE[name]
+
+class TestWithRetry(unittest.TestCase):
+
+    def setUp(self):
+        self.fn = unittest.mock.Mock(
+                    side_effect=Pyro5.errors.CommunicationError("no server"))
+
+    @unittest.mock.patch("random.uniform", return_value=0.0)
+    @unittest.mock.patch("time.sleep")
+    def test_attempts_and_capped_backoff(self, sleep, uniform):
+        self.fn.side_effect = [Pyro5.errors.CommunicationError("down")]*3 \
+                              + ["up"]
+        self.assertEqual(with_retry(self.fn, 22, attempts=5, base=1.0,
+                                    cap=3.0), "up")
+        self.assertEqual(self.fn.call_count, 4)
+        self.fn.assert_called_with(22)
+        self.assertEqual([c.args[0] for c in sleep.call_args_list],
+                         [1.0, 2.0, 3.0])
+
+    @unittest.mock.patch("random.uniform", return_value=0.0)
+    @unittest.mock.patch("time.sleep")
+    def test_reraises_after_last_attempt(self, sleep, uniform):
+        with self.assertRaises(Pyro5.errors.CommunicationError):
+            with_retry(self.fn, attempts=3, base=2.0, cap=30.0)
+        self.assertEqual(self.fn.call_count, 3)
+        # no wait after the last attempt
+        self.assertEqual([c.args[0] for c in sleep.call_args_list],
+                         [2.0, 4.0])
+
+class TestTTLCache(unittest.TestCase):
+    """
+    Cached reads on a front end with a mocked server
+    """
+    def setUp(self):
+        self.fe = K_4ch("K")
+        self.fe.hardware = unittest.mock.Mock()
+        self.fe.hardware.set_WBDC.return_value = True
+        self.fe._owner = threading.get_ident()
+        self.fe._send_command = unittest.mock.Mock(return_value="on")
+        patcher = unittest.mock.patch("time.monotonic", return_value=100.0)
+        self.clock = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_reuses_result_until_expiry(self):
+        self.assertTrue(self.fe.get_ND_state())
+        self.clock.return_value = 100.9
+        self.fe.get_ND_state()
+        self.assertEqual(self.fe.hardware.set_WBDC.call_count, 1)
+        self.clock.return_value = 101.0
+        self.fe.get_ND_state()
+        self.assertEqual(self.fe.hardware.set_WBDC.call_count, 2)
+
+    def test_setter_invalidates(self):
+        self.fe.get_ND_state()
+        self.fe.set_ND_on()
+        self.fe.get_ND_state()
+        self.assertEqual(self.fe.hardware.set_WBDC.call_count, 2)
+
 class TestK_4ch_with_hardware(unittest.TestCase):
 
     @classmethod
     def setUpClass(cls):
-        cls.fe = K_4ch("K",hardware=True)
+        cls.fe = _get_fe("K")
 
     def test_init(self):
-        self.assertTrue(self.fe.channel.keys() == ["F1","F2"])
+        self.assertEqual(set(self.fe.channel.keys()), {"F1", "F2"})
 
     def test_read_temp(self):
         temp = self.fe.read_temps()